@@ -1,8 +1,27 @@
 import os
+import re
+import math
+import sys
+import csv
+import copy
+import json
+import time
+import logging
+import zlib
+import asyncio
+import ipaddress
+import sqlite3
+import datetime
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
 from dotenv import load_dotenv
-from typing import Any, Dict, Optional
-import requests
-from mcp.server.fastmcp import FastMCP
+from typing import Any, Awaitable, Dict, Iterable, List, Optional, Tuple, Union
+import httpx
+import msgspec
+import numpy as np
+from mcp.server.fastmcp import Context, FastMCP
 load_dotenv()
 
 def get_api_key() -> str:
@@ -13,52 +32,1964 @@ def get_api_key() -> str:
     return api_key
 
 
+def parse_api_keys(value: str) -> List[Tuple[str, int]]:
+    """Parse "key1,key2:3" into (key, weight) pairs; the weight defaults to 1"""
+    keys = []
+    for item in value.split(","):
+        key, _, weight = item.strip().partition(":")
+        if key:
+            keys.append((key, int(weight) if weight else 1))
+    return keys
+
+
+def parse_endpoint_limits(value: Optional[str]) -> Dict[str, float]:
+    """Parse "/v3/geocode/geo=100,/v3/direction/driving=20" into {path: limit}"""
+    limits = {}
+    for item in (value or "").split(","):
+        path, _, limit = item.strip().partition("=")
+        if path and limit:
+            limits[path] = float(limit)
+    return limits
+
+
+# AMAP_MAPS_API_KEY 支持以逗号分隔的多个 Key，"key:权重" 指定轮换权重
 AMAP_MAPS_API_KEY = get_api_key()
+AMAP_API_KEYS = parse_api_keys(AMAP_MAPS_API_KEY)
+CHINA_TZ = datetime.timezone(datetime.timedelta(hours=8))
+
+AMAP_BASE_URL = os.getenv("AMAP_BASE_URL", "https://restapi.amap.com")
+# 连接/读取超时（秒）与连接池上限，均可通过环境变量调整
+AMAP_CONNECT_TIMEOUT = float(os.getenv("AMAP_CONNECT_TIMEOUT", "3"))
+AMAP_READ_TIMEOUT = float(os.getenv("AMAP_READ_TIMEOUT", "10"))
+AMAP_MAX_CONNECTIONS = int(os.getenv("AMAP_MAX_CONNECTIONS", "100"))
+AMAP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("AMAP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+AMAP_KEEPALIVE_EXPIRY = float(os.getenv("AMAP_KEEPALIVE_EXPIRY", "30"))
+# 限流：每个 Key 每个接口的 QPS 与每日配额（0 表示不限），可按接口路径单独覆盖
+AMAP_DEFAULT_QPS = float(os.getenv("AMAP_DEFAULT_QPS", "30"))
+AMAP_ENDPOINT_QPS = parse_endpoint_limits(os.getenv("AMAP_ENDPOINT_QPS"))
+AMAP_DEFAULT_DAILY_QUOTA = int(os.getenv("AMAP_DEFAULT_DAILY_QUOTA", "0"))
+AMAP_ENDPOINT_DAILY_QUOTA = parse_endpoint_limits(os.getenv("AMAP_ENDPOINT_DAILY_QUOTA"))
+AMAP_QPS_COOLDOWN = float(os.getenv("AMAP_QPS_COOLDOWN", "1"))
+AMAP_LIMIT_MAX_WAIT = float(os.getenv("AMAP_LIMIT_MAX_WAIT", "60"))
+AMAP_LIMIT_RETRIES = int(os.getenv("AMAP_LIMIT_RETRIES", "3"))
+# 高德 infocode：QPS 超限 / 日配额用尽
+AMAP_QPS_INFOCODES = {"10004", "10014", "10019", "10020", "10021"}
+AMAP_QUOTA_INFOCODES = {"10003", "10044"}
+
+# 高德 Key 以查询参数传递，而 httpx/httpcore 在 INFO 级别记录完整请求 URL，提高其日志级别以免 Key 写入日志
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logging.getLogger("httpcore").setLevel(logging.WARNING)
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the process-wide pooled client used for every Amap request"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            base_url=AMAP_BASE_URL,
+            timeout=httpx.Timeout(AMAP_READ_TIMEOUT, connect=AMAP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=AMAP_MAX_CONNECTIONS,
+                max_keepalive_connections=AMAP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=AMAP_KEEPALIVE_EXPIRY
+            )
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Close the shared client, releasing pooled connections"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+class AmapRateLimitError(httpx.HTTPError):
+    """No API key can serve an endpoint within AMAP_LIMIT_MAX_WAIT (cooling down or out of daily quota)"""
+
+
+class TokenBucket:
+    """Token bucket refilled at ``rate`` tokens per second, bursting up to ``rate`` tokens"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.capacity = max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available (0 when one is available now)"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+
+def next_china_midnight() -> float:
+    """Wall-clock timestamp of the next Beijing-time midnight, when Amap daily quotas reset"""
+    tomorrow = datetime.datetime.now(CHINA_TZ).date() + datetime.timedelta(days=1)
+    return datetime.datetime.combine(tomorrow, datetime.time(), tzinfo=CHINA_TZ).timestamp()
+
+
+class ApiKeyState:
+    """Per-key limiter state: endpoint token buckets, daily usage and cool-down deadlines"""
+
+    def __init__(self, key: str, weight: int):
+        self.key = key
+        self.weight = weight
+        self.current_weight = 0
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.daily_used: Dict[str, int] = {}
+        self.day = datetime.datetime.now(CHINA_TZ).date()
+        self.cooldown_until: Dict[str, float] = {}
+        self.exhausted_until: Dict[str, float] = {}
+        self.limited = 0
+
+    def bucket(self, path: str) -> TokenBucket:
+        if path not in self.buckets:
+            self.buckets[path] = TokenBucket(AMAP_ENDPOINT_QPS.get(path, AMAP_DEFAULT_QPS))
+        return self.buckets[path]
+
+    def has_quota(self, path: str) -> bool:
+        today = datetime.datetime.now(CHINA_TZ).date()
+        if today != self.day:
+            self.day = today
+            self.daily_used.clear()
+            self.exhausted_until.clear()
+        if self.exhausted_until.get(path, 0) > time.time():
+            return False
+        quota = AMAP_ENDPOINT_DAILY_QUOTA.get(path, AMAP_DEFAULT_DAILY_QUOTA)
+        return not quota or self.daily_used.get(path, 0) < quota
+
+    def cooldown_remaining(self, path: str) -> float:
+        return max(self.cooldown_until.get(path, 0) - time.monotonic(), 0.0)
+
+    def masked(self) -> str:
+        return f"{self.key[:4]}****{self.key[-4:]}" if len(self.key) > 8 else "****"
+
+
+def response_field(data: Any, name: str) -> Any:
+    """Top-level field of a response decoded either as a generic dict or as a typed struct"""
+    return data.get(name) if isinstance(data, dict) else getattr(data, name, None)
+
+
+class AmapRateLimiter:
+    """Central limiter in front of every Amap endpoint.
+    
+    Callers queue per endpoint (asyncio.Lock is FIFO) and are handed the next key, chosen by smooth
+    weighted round-robin among keys that have a token, are not cooling down and still have daily
+    quota. When no key is ready the head of the queue sleeps until one is, so bursts are delayed
+    rather than rejected.
+    """
+
+    def __init__(self, keys: List[Tuple[str, int]]):
+        self.keys = [ApiKeyState(key, weight) for key, weight in keys]
+        self._queues: Dict[str, asyncio.Lock] = {}
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    async def acquire(self, path: str) -> ApiKeyState:
+        queue = self._queues.setdefault(path, asyncio.Lock())
+        started = time.monotonic()
+        async with queue:
+            while True:
+                candidates = [key for key in self.keys if key.has_quota(path)]
+                if not candidates:
+                    raise AmapRateLimitError(f"Daily quota exhausted for {path} on every API key")
+                ready = [key for key in candidates if not key.cooldown_remaining(path) and not key.bucket(path).wait_time()]
+                if ready:
+                    chosen = self._pick(ready)
+                    chosen.bucket(path).take()
+                    chosen.daily_used[path] = chosen.daily_used.get(path, 0) + 1
+                    waited = time.monotonic() - started
+                    if waited > 0.001:
+                        self.waits += 1
+                        self.wait_seconds += waited
+                    return chosen
+                delay = min(max(key.cooldown_remaining(path), key.bucket(path).wait_time()) for key in candidates)
+                if time.monotonic() - started + delay > AMAP_LIMIT_MAX_WAIT:
+                    raise AmapRateLimitError(f"Rate limit wait for {path} exceeded {AMAP_LIMIT_MAX_WAIT}s")
+                await asyncio.sleep(delay)
+
+    def _pick(self, ready: List[ApiKeyState]) -> ApiKeyState:
+        total = sum(key.weight for key in ready)
+        for key in ready:
+            key.current_weight += key.weight
+        chosen = max(ready, key=lambda key: key.current_weight)
+        chosen.current_weight -= total
+        return chosen
+
+    def report(self, key: ApiKeyState, path: str, data: Any) -> bool:
+        """Inspect a response; cool the key down and return True when Amap rejected it for QPS/quota"""
+        infocode = str(response_field(data, "infocode") or response_field(data, "errcode") or "")
+        if infocode in AMAP_QPS_INFOCODES:
+            key.cooldown_until[path] = time.monotonic() + AMAP_QPS_COOLDOWN
+        elif infocode in AMAP_QUOTA_INFOCODES:
+            key.exhausted_until[path] = next_china_midnight()
+        else:
+            return False
+        key.limited += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued_waits": self.waits,
+            "wait_seconds": round(self.wait_seconds, 3),
+            "keys": [
+                {
+                    "key": key.masked(),
+                    "weight": key.weight,
+                    "limited": key.limited,
+                    "daily_used": dict(key.daily_used),
+                    "cooling_down": [path for path in key.cooldown_until if key.cooldown_remaining(path)],
+                    "exhausted": [path for path, until in key.exhausted_until.items() if until > time.time()]
+                }
+                for key in self.keys
+            ]
+        }
+
+
+rate_limiter = AmapRateLimiter(AMAP_API_KEYS)
+
+
+class SingleFlight:
+    """Coalesce concurrent identical calls into one upstream request.
+    
+    The first caller starts the request as its own task; callers arriving while it is in flight
+    await the same task. Each caller awaits through asyncio.shield, so a cancelled caller never
+    cancels the request the others are waiting on. The shared result must be treated as read-only.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Tuple[Any, ...], "asyncio.Future[Any]"] = {}
+        self.leaders = 0
+        self.deduplicated = 0
+
+    async def do(self, key: Tuple[Any, ...], fn: Any) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._inflight.pop(key) if self._inflight.get(key) is done else None)
+            self.leaders += 1
+        else:
+            self.deduplicated += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"upstream_calls": self.leaders, "deduplicated": self.deduplicated, "in_flight": len(self._inflight)}
+
+
+single_flight = SingleFlight()
+
+
+async def amap_get(path: str, params: Dict[str, Any], decode_type: Any = None) -> Any:
+    """Send a GET request to the Amap REST API and return the decoded JSON body.
+    
+    The body is a generic dict, or an instance of ``decode_type`` (a msgspec Struct) when given.
+    Concurrent identical requests (same endpoint and params) share one upstream call; the returned
+    body may be shared between callers and must not be mutated.
+    """
+    key = (path, decode_type, tuple(sorted((name, str(value)) for name, value in params.items())))
+    return await single_flight.do(key, lambda: amap_fetch(path, params, decode_type))
+
+
+async def amap_fetch(path: str, params: Dict[str, Any], decode_type: Any = None) -> Any:
+    """Perform one Amap request through the rate limiter.
+    
+    Responses rejected for QPS or daily quota are retried on another key (or the same key after its
+    cool-down) up to AMAP_LIMIT_RETRIES times.
+    """
+    for _ in range(AMAP_LIMIT_RETRIES + 1):
+        api_key = await rate_limiter.acquire(path)
+        response = await get_http_client().get(path, params={"key": api_key.key, **params})
+        response.raise_for_status()
+        try:
+            data = msgspec.json.decode(response.content, type=decode_type) if decode_type else response.json()
+        except (ValueError, msgspec.DecodeError) as e:
+            raise httpx.DecodingError(f"Invalid JSON response: {e}", request=response.request) from e
+        if not rate_limiter.report(api_key, path, data):
+            break
+    return data
+
+
+class TTLCache:
+    """In-memory LRU cache whose entries expire after a time-to-live (seconds)"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+class SqliteCache:
+    """Persistent cache tier: JSON values in a SQLite table with an absolute expiry timestamp.
+    
+    Writes run in worker threads (see TieredCache) on their own connection, serialized by a lock;
+    each write transaction also purges expired rows. Reads use a separate connection on the event
+    loop thread and never wait for a writer: in WAL mode they see the last committed state, and
+    expired rows are simply skipped.
+    """
+
+    def __init__(self, path: str, table: str):
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_expires_at ON {table} (expires_at)")
+        self._conn.commit()
+        self._reader = sqlite3.connect(path)
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        row = self._reader.execute(
+            f"SELECT value, expires_at FROM {self.table} WHERE key = ? AND expires_at > ?",
+            (key, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set_many(self, items: List[Tuple[str, Any]], ttl: float) -> None:
+        """Write all entries and purge expired rows in one transaction"""
+        now = time.time()
+        rows = [(key, json.dumps(value, ensure_ascii=False), now + ttl) for key, value in items]
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,))
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        self._reader.close()
+        with self._lock:
+            self._conn.close()
+
+
+class TieredCache:
+    """Memory LRU in front of an optional SQLite tier. Values are deep-copied on read so callers may mutate them.
+    
+    Writes land in memory immediately; the disk tier is written off the event loop, one transaction per call.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float, db_path: Optional[str] = None):
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize, ttl)
+        self.disk = SqliteCache(db_path, name) if db_path else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Any:
+        value = self.memory.get(key)
+        if value is not None:
+            self.memory_hits += 1
+            return copy.deepcopy(value)
+        if self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                self.memory.set(key, value, ttl=min(self.ttl, expires_at - time.time()))
+                self.disk_hits += 1
+                return copy.deepcopy(value)
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Any) -> None:
+        await self.set_many([(key, value)])
+
+    async def set_many(self, items: List[Tuple[str, Any]]) -> None:
+        for key, value in items:
+            self.memory.set(key, copy.deepcopy(value))
+        if self.disk is not None and items:
+            await asyncio.to_thread(self.disk.set_many, items, self.ttl)
+
+    def close(self) -> None:
+        if self.disk is not None:
+            self.disk.close()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_size": len(self.memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0
+        }
+
+
+# 地理/逆地理编码缓存：内存LRU + SQLite持久层，AMAP_GEOCODE_CACHE_DB 置空可关闭磁盘层
+AMAP_GEOCODE_CACHE_SIZE = int(os.getenv("AMAP_GEOCODE_CACHE_SIZE", "10000"))
+AMAP_GEOCODE_CACHE_TTL = float(os.getenv("AMAP_GEOCODE_CACHE_TTL", str(30 * 24 * 3600)))
+AMAP_GEOCODE_CACHE_DB = os.getenv(
+    "AMAP_GEOCODE_CACHE_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "amap_cache.sqlite3")
+)
+
+geocode_cache = TieredCache("geocode", AMAP_GEOCODE_CACHE_SIZE, AMAP_GEOCODE_CACHE_TTL, AMAP_GEOCODE_CACHE_DB)
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Normalize free-form input for use in cache keys (NFKC, case-folded, collapsed whitespace)"""
+    if not text:
+        return ""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip().lower()
+
+
+def parse_location(location: str) -> Tuple[float, float]:
+    """Parse a "longitude,latitude" string"""
+    lng, lat = location.split(",")
+    return float(lng), float(lat)
+
+
+def geo_cache_key(address: str, city: Optional[str] = None) -> str:
+    return f"geo:{normalize_text(address)}|{normalize_text(city)}"
+
+
+def regeo_cache_key(location: str) -> Optional[str]:
+    """Coordinates are rounded to 6 decimals (~0.1 m); unparsable input is not cached"""
+    try:
+        lng, lat = parse_location(location)
+    except ValueError:
+        return None
+    return f"regeo:{lng:.6f},{lat:.6f}"
+
+
+# POI 详情缓存：长TTL，maps_search_detail 的结果以及 full_detail 关键词搜/周边搜返回的 POI 会写入
+AMAP_POI_CACHE_SIZE = int(os.getenv("AMAP_POI_CACHE_SIZE", "50000"))
+AMAP_POI_CACHE_TTL = float(os.getenv("AMAP_POI_CACHE_TTL", str(7 * 24 * 3600)))
+
+poi_detail_cache = TTLCache(AMAP_POI_CACHE_SIZE, AMAP_POI_CACHE_TTL)
+
+
+# 路线规划响应的类型化结构：只声明工具实际返回或使用的字段，其余字段（路况 tmcs、途经城市等）在解码时直接跳过。
+# 高德以字符串表示数值、以 [] 表示空值，标量字段统一使用 AmapValue
+AmapValue = Union[str, int, float, List[Any], None]
+
+
+class AmapStruct(msgspec.Struct, omit_defaults=True):
+    pass
+
+
+class AmapResponse(AmapStruct):
+    """Status envelope of v3 (status/info/infocode) and v4 (errcode/errmsg) responses"""
+    status: AmapValue = None
+    info: AmapValue = None
+    infocode: AmapValue = None
+    errcode: AmapValue = None
+    errmsg: AmapValue = None
+
+
+class RouteStep(AmapStruct):
+    instruction: AmapValue = None
+    road: AmapValue = None
+    distance: AmapValue = None
+    orientation: AmapValue = None
+    duration: AmapValue = None
+    polyline: AmapValue = None
+
+
+class RoutePath(AmapStruct):
+    distance: AmapValue = None
+    duration: AmapValue = None
+    tolls: AmapValue = None
+    steps: List[RouteStep] = []
+
+
+class RoutePlan(AmapStruct):
+    origin: AmapValue = None
+    destination: AmapValue = None
+    paths: List[RoutePath] = []
+
+
+class RouteResponse(AmapResponse):
+    """/v3/direction/driving and /v3/direction/walking"""
+    route: Union[RoutePlan, List[Any], None] = None
+
+
+class BicyclingResponse(AmapResponse):
+    """/v4/direction/bicycling"""
+    data: Union[RoutePlan, List[Any], None] = None
+
+
+class TransitWalkingStep(AmapStruct):
+    instruction: AmapValue = None
+    road: AmapValue = None
+    distance: AmapValue = None
+    action: AmapValue = None
+    assistant_action: AmapValue = None
+    polyline: AmapValue = None
+
+
+class TransitWalking(AmapStruct):
+    origin: AmapValue = None
+    destination: AmapValue = None
+    distance: AmapValue = None
+    duration: AmapValue = None
+    steps: List[TransitWalkingStep] = []
+
+
+class TransitStop(AmapStruct):
+    name: AmapValue = None
+
+
+class Busline(AmapStruct):
+    name: AmapValue = None
+    departure_stop: Union[TransitStop, List[Any], None] = None
+    arrival_stop: Union[TransitStop, List[Any], None] = None
+    distance: AmapValue = None
+    duration: AmapValue = None
+    polyline: AmapValue = None
+    via_stops: List[TransitStop] = []
+
+
+class TransitBus(AmapStruct):
+    buslines: List[Busline] = []
+
+
+class Railway(AmapStruct):
+    name: AmapValue = None
+    trip: AmapValue = None
+
+
+class TransitSegment(AmapStruct):
+    walking: Union[TransitWalking, List[Any], None] = None
+    bus: Union[TransitBus, List[Any], None] = None
+    entrance: Union[TransitStop, List[Any], None] = None
+    exit: Union[TransitStop, List[Any], None] = None
+    railway: Union[Railway, List[Any], None] = None
+
+
+class TransitPlan(AmapStruct):
+    distance: AmapValue = None
+    duration: AmapValue = None
+    walking_distance: AmapValue = None
+    cost: AmapValue = None
+    segments: List[TransitSegment] = []
+
+
+class TransitRoute(AmapStruct):
+    origin: AmapValue = None
+    destination: AmapValue = None
+    distance: AmapValue = None
+    transits: List[TransitPlan] = []
+
+
+class TransitResponse(AmapResponse):
+    """/v3/direction/transit/integrated"""
+    route: Union[TransitRoute, List[Any], None] = None
+
+
+def as_struct(value: Any, empty: AmapStruct) -> Any:
+    """Amap encodes empty objects as [], substitute an all-default struct for those"""
+    return value if isinstance(value, AmapStruct) else empty
+
+
+# 路线缓存：起终点吸附到网格（米）后作为键，各出行方式独立TTL（驾车受路况影响较短），
+# 条目以 zlib 压缩的 JSON 存储，按压缩后总字节数做LRU淘汰
+AMAP_ROUTE_CACHE_GRID_M = float(os.getenv("AMAP_ROUTE_CACHE_GRID_M", "50"))
+AMAP_ROUTE_CACHE_MAX_BYTES = int(os.getenv("AMAP_ROUTE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+AMAP_ROUTE_CACHE_TTL = {
+    "driving": float(os.getenv("AMAP_ROUTE_CACHE_TTL_DRIVING", "300")),
+    "walking": float(os.getenv("AMAP_ROUTE_CACHE_TTL_WALKING", str(24 * 3600))),
+    "bicycling": float(os.getenv("AMAP_ROUTE_CACHE_TTL_BICYCLING", str(24 * 3600))),
+    "transit": float(os.getenv("AMAP_ROUTE_CACHE_TTL_TRANSIT", "1800"))
+}
+
+
+class CompressedLRUCache:
+    """LRU cache of zlib-compressed JSON values, bounded by total compressed bytes, with per-entry TTL.
+    Values may be plain JSON data or msgspec structs; reads decode into ``decode_type`` (generic
+    data by default). Every read decompresses into a fresh object, so callers may mutate what they
+    get back."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+
+    def get(self, key: str, decode_type: Any = Any) -> Any:
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                self._evict(key)
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return msgspec.json.decode(zlib.decompress(entry[1]), type=decode_type)
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        blob = zlib.compress(msgspec.json.encode(value))
+        if len(blob) > self.max_bytes:
+            return
+        if key in self._data:
+            self._evict(key)
+        self._data[key] = (time.monotonic() + ttl, blob)
+        self.bytes += len(blob)
+        while self.bytes > self.max_bytes:
+            self._evict(next(iter(self._data)))
+
+    def _evict(self, key: str) -> None:
+        self.bytes -= len(self._data.pop(key)[1])
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self._data), "bytes": self.bytes, "hits": self.hits, "misses": self.misses}
+
+
+route_cache = CompressedLRUCache(AMAP_ROUTE_CACHE_MAX_BYTES)
+
+
+def snap_location(location: str, grid_m: float) -> str:
+    """Snap "lng,lat" to a grid of roughly ``grid_m`` metres"""
+    lng, lat = parse_location(location)
+    step = grid_m / 111320.0
+    return f"{round(lng / step) * step:.6f},{round(lat / step) * step:.6f}"
+
+
+def route_cache_key(mode: str, origin: str, destination: str, *extra: str) -> Optional[str]:
+    try:
+        return "|".join((mode, snap_location(origin, AMAP_ROUTE_CACHE_GRID_M), snap_location(destination, AMAP_ROUTE_CACHE_GRID_M)) + extra)
+    except ValueError:
+        return None
+
+
+async def cached_route(mode: str, path: str, params: Dict[str, Any], decode_type: Any = None) -> Any:
+    """Fetch a route through the quantized-coordinate route cache; only successful plans are cached"""
+    key = route_cache_key(mode, params["origin"], params["destination"], *(str(params.get(name, "")) for name in ("city", "cityd")))
+    if key:
+        cached = route_cache.get(key, decode_type or Any)
+        if cached is not None:
+            return cached
+    data = await amap_get(path, params=params, decode_type=decode_type)
+    if key and (response_field(data, "status") == "1" or response_field(data, "errcode") == 0):
+        route_cache.set(key, data, AMAP_ROUTE_CACHE_TTL[mode])
+    return data
+
+
+# IP 定位缓存：按 /24 网段存储在有序数组中，高德仅能定位到城市级别，因此使用长TTL；
+# AMAP_IP_PRELOAD_FILE 可指定 "网段,省份,城市,adcode,矩形区域" 格式的 CSV 在启动时批量预加载
+AMAP_IP_CACHE_TTL = int(os.getenv("AMAP_IP_CACHE_TTL", str(30 * 24 * 3600)))
+AMAP_IP_CACHE_MAX_ENTRIES = int(os.getenv("AMAP_IP_CACHE_MAX_ENTRIES", "2000000"))
+AMAP_IP_PRELOAD_FILE = os.getenv("AMAP_IP_PRELOAD_FILE", "")
+
+
+class IpPrefixCache:
+    """IPv4 location cache keyed by /24 prefix, stored as sorted parallel arrays.
+    
+    Prefixes (address >> 8), expiry timestamps (0 = never, used for preloaded rows) and record
+    numbers are uint32 numpy arrays; the distinct (province, city, adcode, rectangle) records are
+    interned, so each cached prefix costs about 12 bytes. New prefixes go to a small dict buffer
+    that is merged into the sorted arrays every ``merge_batch`` inserts, so an insert never shifts
+    the arrays. Expired entries are dropped at merge time, and only when the earliest expiry has
+    actually passed; when the cache is still over ``max_entries`` the soonest-expiring learned
+    entries are evicted in bulk (preloaded rows are kept).
+    """
+
+    def __init__(self, ttl: int, max_entries: int, merge_batch: int = 4096):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.merge_batch = merge_batch
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._prefixes = np.empty(0, dtype=np.uint32)
+        self._expires = np.empty(0, dtype=np.uint32)
+        self._record_ids = np.empty(0, dtype=np.uint32)
+        self._pending: Dict[int, Tuple[int, int]] = {}
+        self._preloaded = 0
+        self._next_expiry = math.inf
+        self._records: List[Tuple[str, str, str, str]] = []
+        self._record_index: Dict[Tuple[str, str, str, str], int] = {}
+
+    def __len__(self) -> int:
+        return len(self._prefixes) + len(self._pending)
+
+    @staticmethod
+    def prefix_of(ip: str) -> Optional[int]:
+        try:
+            return int(ipaddress.IPv4Address(ip.strip())) >> 8
+        except ValueError:
+            return None
+
+    def _record_id(self, record: Tuple[str, str, str, str]) -> int:
+        record_id = self._record_index.get(record)
+        if record_id is None:
+            record_id = self._record_index[record] = len(self._records)
+            self._records.append(record)
+        return record_id
+
+    def _find(self, prefix: int) -> int:
+        """Index of ``prefix`` in the sorted arrays, or -1"""
+        index = int(self._prefixes.searchsorted(np.uint32(prefix)))
+        return index if index < len(self._prefixes) and self._prefixes[index] == prefix else -1
+
+    def get(self, ip: str) -> Optional[Dict[str, str]]:
+        prefix = self.prefix_of(ip)
+        entry = None
+        if prefix is not None:
+            entry = self._pending.get(prefix)
+            if entry is None:
+                index = self._find(prefix)
+                if index >= 0:
+                    entry = (int(self._expires[index]), int(self._record_ids[index]))
+        if entry is None or 0 < entry[0] <= time.time():
+            self.misses += 1
+            return None
+        self.hits += 1
+        province, city, adcode, rectangle = self._records[entry[1]]
+        return {"province": province, "city": city, "adcode": adcode, "rectangle": rectangle}
+
+    def set(self, ip: str, record: Tuple[str, str, str, str]) -> None:
+        prefix = self.prefix_of(ip)
+        if prefix is None or self._preloaded >= self.max_entries:
+            # 预加载数据已占满容量时不再学习新网段
+            return
+        expires = int(time.time()) + self.ttl
+        record_id = self._record_id(record)
+        self._next_expiry = min(self._next_expiry, expires)
+        index = self._find(prefix) if prefix not in self._pending else -1
+        if index >= 0:
+            self._expires[index] = expires
+            self._record_ids[index] = record_id
+            return
+        self._pending[prefix] = (expires, record_id)
+        if len(self._pending) >= self.merge_batch or len(self) > self.max_entries:
+            self._merge()
+
+    def _merge(self) -> None:
+        """Fold the pending buffer into the sorted arrays, purge expired entries and enforce max_entries"""
+        prefixes, expires, record_ids = self._prefixes, self._expires, self._record_ids
+        if self._pending:
+            pending = np.array(sorted((prefix, *entry) for prefix, entry in self._pending.items()), dtype=np.uint32).reshape(-1, 3)
+            self._pending = {}
+            # 缓冲区中的网段都不在有序数组里，按插入位置一次性合并，整体为线性复制
+            positions = prefixes.searchsorted(pending[:, 0])
+            prefixes = np.insert(prefixes, positions, pending[:, 0])
+            expires = np.insert(expires, positions, pending[:, 1])
+            record_ids = np.insert(record_ids, positions, pending[:, 2])
+        if self._next_expiry <= time.time():
+            keep = (expires == 0) | (expires > time.time())
+            prefixes, expires, record_ids = prefixes[keep], expires[keep], record_ids[keep]
+        excess = len(prefixes) - self.max_entries
+        if excess > 0:
+            # 按到期时间淘汰最早到期的已学习条目，并多腾出一批空间，避免每次写入都触发淘汰
+            learned = np.flatnonzero(expires)
+            count = min(len(learned), excess + min(self.merge_batch, self.max_entries // 10))
+            if count:
+                victims = learned[np.argpartition(expires[learned], count - 1)[:count]] if count < len(learned) else learned
+                keep = np.ones(len(prefixes), dtype=bool)
+                keep[victims] = False
+                prefixes, expires, record_ids = prefixes[keep], expires[keep], record_ids[keep]
+                self.evicted += count
+        learned_expires = expires[expires > 0]
+        self._next_expiry = float(learned_expires.min()) if len(learned_expires) else math.inf
+        self._prefixes, self._expires, self._record_ids = prefixes, expires, record_ids
+
+    def preload(self, path: str) -> int:
+        """Bulk-load "prefix,province,city,adcode,rectangle" rows (prefix like 1.2.3.0/24, /16 to /24
+        accepted) as non-expiring entries, up to max_entries prefixes; arrays are rebuilt once.
+        Returns the number of /24 prefixes loaded"""
+        self._merge()
+        entries = {
+            prefix: (expires, record_id)
+            for prefix, expires, record_id in zip(self._prefixes.tolist(), self._expires.tolist(), self._record_ids.tolist())
+        }
+        loaded = 0
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            for row in csv.reader(f):
+                if len(row) < 5:
+                    continue
+                try:
+                    network = ipaddress.IPv4Network(row[0].strip(), strict=False)
+                except ValueError:
+                    continue
+                if not 16 <= network.prefixlen <= 24:
+                    continue
+                record_id = self._record_id(tuple(value.strip() for value in row[1:5]))
+                first = int(network.network_address) >> 8
+                for prefix in range(first, first + (1 << (24 - network.prefixlen))):
+                    if prefix not in entries and len(entries) >= self.max_entries:
+                        break
+                    entries[prefix] = (0, record_id)
+                    loaded += 1
+                if len(entries) >= self.max_entries:
+                    break
+        prefixes = sorted(entries)
+        self._prefixes = np.array(prefixes, dtype=np.uint32)
+        self._expires = np.array([entries[prefix][0] for prefix in prefixes], dtype=np.uint32)
+        self._record_ids = np.array([entries[prefix][1] for prefix in prefixes], dtype=np.uint32)
+        learned_expires = self._expires[self._expires > 0]
+        self._preloaded = len(self._expires) - len(learned_expires)
+        self._next_expiry = float(learned_expires.min()) if len(learned_expires) else math.inf
+        return loaded
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "prefixes": len(self),
+            "pending": len(self._pending),
+            "records": len(self._records),
+            "evicted": self.evicted,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+ip_cache = IpPrefixCache(AMAP_IP_CACHE_TTL, AMAP_IP_CACHE_MAX_ENTRIES)
+if AMAP_IP_PRELOAD_FILE:
+    ip_cache.preload(AMAP_IP_PRELOAD_FILE)
+
+
+# 行政区划离线索引：名称/简称/别名 -> adcode/citycode，启动时加载，可通过 maps_reload_adcode_index 刷新
+AMAP_ADCODE_INDEX_FILE = os.getenv(
+    "AMAP_ADCODE_INDEX_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "amap_adcode_citycode.csv")
+)
+# 内置数据只到地级市（及直辖市区县），县级名称不在其中；加载高德完整区县表后可置为 true，拒绝无法识别的城市名
+AMAP_ADCODE_INDEX_COMPLETE = os.getenv("AMAP_ADCODE_INDEX_COMPLETE", "false").lower() in ("1", "true", "yes")
+ADMIN_SUFFIXES = ("特别行政区", "维吾尔自治区", "壮族自治区", "回族自治区", "自治区", "自治州", "地区", "省", "市", "盟")
+
+
+def short_admin_name(name: str) -> str:
+    """Strip the administrative suffix ("广西壮族自治区" -> "广西", "北京市" -> "北京"); districts/counties are kept whole"""
+    for suffix in ADMIN_SUFFIXES:
+        if name.endswith(suffix) and len(name) - len(suffix) >= 2:
+            return name[:-len(suffix)]
+    return name
+
+
+ADMIN_LEVEL_RANKS = {"city": 0, "province": 1, "district": 2, "country": 3}
+
+
+def admin_level(adcode: int, citycode: str) -> str:
+    """Level of an Amap adcode row; municipalities, Hong Kong, Macau and Taiwan carry a citycode and count
+    as cities, as do county-level units administered directly by a province (xx90xx)"""
+    if adcode == 100000:
+        return "country"
+    if adcode % 10000 == 0:
+        return "city" if citycode else "province"
+    if adcode % 100 == 0 or adcode // 100 % 100 == 90:
+        return "city"
+    return "district"
+
+
+class AdcodeIndex:
+    """Offline index of administrative divisions keyed by name, short name, alias, adcode and citycode.
+    
+    Rows are kept in compact parallel arrays and every name maps to a row number. The CSV uses
+    Amap's adcode table columns (name, adcode, citycode) plus an optional "|"-separated aliases
+    column. Full names win over short names and aliases; colliding short names and aliases
+    resolve by level (city, then province, then district), so "吉林" is 吉林市 rather than
+    吉林省, and earlier rows win within a level.
+    """
+
+    def __init__(self, path: Optional[str] = None, complete: bool = False):
+        self.path = path
+        self.complete = complete
+        self._adcodes = array("I")
+        self._citycodes: List[str] = []
+        self._names: List[str] = []
+        self._by_name: Dict[str, int] = {}
+        self._by_adcode: Dict[int, int] = {}
+        self._by_citycode: Dict[str, int] = {}
+        if path and os.path.exists(path):
+            self.reload()
+
+    def __len__(self) -> int:
+        return len(self._adcodes)
+
+    def reload(self, path: Optional[str] = None) -> int:
+        """Rebuild the index from ``path`` (default: the current file) and swap it in; returns the row count"""
+        path = path or self.path
+        adcodes = array("I")
+        citycodes: List[str] = []
+        names: List[str] = []
+        by_name: Dict[str, int] = {}
+        by_adcode: Dict[int, int] = {}
+        by_citycode: Dict[str, int] = {}
+        short_names: Dict[str, Tuple[int, int]] = {}
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            for row in csv.reader(f):
+                if len(row) < 2 or not row[1].strip().isdigit():
+                    continue
+                name = row[0].strip()
+                adcode = int(row[1])
+                citycode = row[2].strip() if len(row) > 2 and row[2].strip() != "\\N" else ""
+                index = len(adcodes)
+                adcodes.append(adcode)
+                citycodes.append(sys.intern(citycode))
+                names.append(name)
+                by_adcode.setdefault(adcode, index)
+                by_name.setdefault(normalize_text(name), index)
+                rank = ADMIN_LEVEL_RANKS[admin_level(adcode, citycode)]
+                if citycode and rank == 0:
+                    by_citycode.setdefault(citycode, index)
+                aliases = [short_admin_name(name)] + (row[3].split("|") if len(row) > 3 else [])
+                for alias in aliases:
+                    alias = normalize_text(alias)
+                    if alias and (alias not in short_names or rank < short_names[alias][0]):
+                        short_names[alias] = (rank, index)
+        for alias, (_, index) in short_names.items():
+            by_name.setdefault(alias, index)
+        self.path = path
+        self._adcodes, self._citycodes, self._names = adcodes, citycodes, names
+        self._by_name, self._by_adcode, self._by_citycode = by_name, by_adcode, by_citycode
+        return len(adcodes)
+
+    def lookup(self, query: Optional[str]) -> Optional[Dict[str, str]]:
+        """Resolve a name, short name, alias, adcode (6 digits) or city-level citycode to
+        {"name", "adcode", "citycode", "level"}"""
+        key = normalize_text(query)
+        if not key:
+            return None
+        if key.isdigit():
+            index = self._by_adcode.get(int(key)) if len(key) == 6 else self._by_citycode.get(key)
+        else:
+            index = self._by_name.get(key)
+        if index is None:
+            return None
+        return {
+            "name": self._names[index],
+            "adcode": f"{self._adcodes[index]:06d}",
+            "citycode": self._citycodes[index],
+            "level": admin_level(self._adcodes[index], self._citycodes[index])
+        }
+
+    def resolve_city(self, city: str) -> Tuple[Optional[str], Optional[str]]:
+        """Normalize a city argument for Amap's transit API to (citycode or canonical name, error).
+        
+        Inputs that resolve to a province or the whole country are rejected. Names missing from the
+        index (county-level cities such as 昆山) are passed through for Amap to resolve, unless the
+        index is marked complete.
+        """
+        if not normalize_text(city):
+            return None, "city is required"
+        entry = self.lookup(city)
+        if entry is None:
+            if self.complete and len(self):
+                return None, f"Unknown city: {city}"
+            return city.strip(), None
+        if entry["level"] in ("province", "country"):
+            return None, f"{city} resolves to {entry['name']}, which is not a city"
+        return entry["citycode"] or entry["name"], None
+
+
+adcode_index = AdcodeIndex(AMAP_ADCODE_INDEX_FILE, AMAP_ADCODE_INDEX_COMPLETE)
+
+
+# 离线逆地理编码：区县边界 GeoJSON（要素属性为 province/city/district/adcode，可选 citycode），
+# 未配置或坐标不在任何边界内时回退到高德接口；网格大小（度）与射线法单块计算量上限
+AMAP_DISTRICT_BOUNDARIES = os.getenv("AMAP_DISTRICT_BOUNDARIES", "")
+AMAP_DISTRICT_CELL_DEG = float(os.getenv("AMAP_DISTRICT_CELL_DEG", "0.25"))
+AMAP_DISTRICT_RAYCAST_BLOCK = 4_000_000
+
+
+class DistrictIndex:
+    """Offline reverse geocoder over district boundary polygons.
+    
+    Every feature's rings (outer rings and holes, Polygon or MultiPolygon) are flattened into
+    one edge array. A coarse grid maps each cell to the features whose bounding box overlaps
+    it; a lookup filters candidates by cell and bounding box, then ray-casts against their
+    edges with the even-odd rule, so holes and enclaves resolve correctly. Lookups are
+    vectorized over whole batches of points.
+    """
+
+    def __init__(self, path: Optional[str] = None, cell_deg: float = 0.25):
+        self.path = path
+        self.cell_deg = cell_deg
+        self._components: List[Dict[str, str]] = []
+        self._bboxes = np.empty((0, 4), dtype=np.float64)
+        self._edges: List[Tuple[np.ndarray, ...]] = []
+        self._grid: Dict[Tuple[int, int], List[int]] = {}
+        self.hits = 0
+        self.misses = 0
+        if path and os.path.exists(path):
+            self.reload()
+
+    def __len__(self) -> int:
+        return len(self._components)
+
+    def reload(self, path: Optional[str] = None) -> int:
+        """Rebuild the index from the GeoJSON at ``path`` (default: the current file) and swap it in; returns the feature count"""
+        path = path or self.path
+        with open(path, encoding="utf-8-sig") as f:
+            data = json.load(f)
+        features = (data.get("features") or []) if data.get("type") == "FeatureCollection" else [data]
+        components: List[Dict[str, str]] = []
+        bboxes: List[Tuple[float, float, float, float]] = []
+        edges: List[Tuple[np.ndarray, ...]] = []
+        grid: Dict[Tuple[int, int], List[int]] = {}
+        for feature in features:
+            geometry = feature.get("geometry") or {}
+            if geometry.get("type") == "Polygon":
+                polygons = [geometry.get("coordinates") or []]
+            elif geometry.get("type") == "MultiPolygon":
+                polygons = geometry.get("coordinates") or []
+            else:
+                continue
+            rings = [np.asarray(ring, dtype=np.float64)[:, :2] for polygon in polygons for ring in polygon if len(ring) >= 3]
+            if not rings:
+                continue
+            starts = np.concatenate(rings)
+            ends = np.concatenate([np.roll(ring, -1, axis=0) for ring in rings])
+            properties = feature.get("properties") or {}
+            adcode = str(properties.get("adcode") or "")
+            known = (adcode_index.lookup(adcode) or adcode_index.lookup(adcode[:4] + "00")) if adcode.isdigit() else None
+            index = len(components)
+            components.append({
+                "province": properties.get("province") or "",
+                "city": properties.get("city") or "",
+                "district": properties.get("district") or "",
+                "adcode": adcode,
+                "citycode": str(properties.get("citycode") or (known or {}).get("citycode") or "")
+            })
+            min_lng, min_lat = starts.min(axis=0)
+            max_lng, max_lat = starts.max(axis=0)
+            bboxes.append((min_lng, min_lat, max_lng, max_lat))
+            edges.append((starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1] - starts[:, 1]))
+            for cx in range(math.floor(min_lng / self.cell_deg), math.floor(max_lng / self.cell_deg) + 1):
+                for cy in range(math.floor(min_lat / self.cell_deg), math.floor(max_lat / self.cell_deg) + 1):
+                    grid.setdefault((cx, cy), []).append(index)
+        self.path = path
+        self._components, self._edges, self._grid = components, edges, grid
+        self._bboxes = np.array(bboxes, dtype=np.float64).reshape(-1, 4)
+        return len(components)
+
+    def _contains(self, index: int, points: np.ndarray) -> np.ndarray:
+        """Even-odd ray cast of ``points`` against every edge of feature ``index``"""
+        x1, y1, x2, dy = self._edges[index]
+        inside = np.zeros(len(points), dtype=bool)
+        step = max(1, AMAP_DISTRICT_RAYCAST_BLOCK // len(x1))
+        for start in range(0, len(points), step):
+            x = points[start:start + step, 0:1]
+            y = points[start:start + step, 1:2]
+            straddles = (y1 > y) != (y1 + dy > y)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                crossing = x1 + (y - y1) * (x2 - x1) / dy
+            inside[start:start + step] = np.count_nonzero(straddles & (x < crossing), axis=1) % 2 == 1
+        return inside
+
+    def locate(self, points: np.ndarray) -> np.ndarray:
+        """Feature index containing each (lng, lat) point, -1 where no boundary matches"""
+        result = np.full(len(points), -1, dtype=np.int64)
+        valid = np.flatnonzero(np.isfinite(points).all(axis=1))
+        if not self._components or not len(valid):
+            return result
+        cells, inverse = np.unique(np.floor(points[valid] / self.cell_deg).astype(np.int64), axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        order = valid[np.argsort(inverse, kind="stable")]
+        bounds = np.searchsorted(np.sort(inverse), np.arange(len(cells) + 1))
+        for cell, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+            candidates = self._grid.get((int(cells[cell, 0]), int(cells[cell, 1])))
+            if not candidates:
+                continue
+            members = order[start:end]
+            for index in candidates:
+                pending = members[result[members] < 0]
+                if not len(pending):
+                    break
+                min_lng, min_lat, max_lng, max_lat = self._bboxes[index]
+                lng, lat = points[pending, 0], points[pending, 1]
+                pending = pending[(lng >= min_lng) & (lng <= max_lng) & (lat >= min_lat) & (lat <= max_lat)]
+                if len(pending):
+                    result[pending[self._contains(index, points[pending])]] = index
+        return result
+
+    def lookup_many(self, locations: List[str]) -> List[Optional[Dict[str, str]]]:
+        """Resolve "lng,lat" strings to {"province", "city", "district", "adcode", "citycode"}; None for invalid or uncovered points"""
+        if not self._components:
+            return [None] * len(locations)
+        points = np.full((len(locations), 2), np.nan)
+        for i, location in enumerate(locations):
+            try:
+                points[i] = parse_location(location)
+            except (TypeError, ValueError):
+                pass
+        matches = self.locate(points).tolist()
+        results = [dict(self._components[index]) if index >= 0 else None for index in matches]
+        found = sum(result is not None for result in results)
+        self.hits += found
+        self.misses += len(results) - found
+        return results
+
+    def lookup(self, location: str) -> Optional[Dict[str, str]]:
+        return self.lookup_many([location])[0]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"path": self.path, "features": len(self._components), "cells": len(self._grid), "hits": self.hits, "misses": self.misses}
+
+
+district_index = DistrictIndex(AMAP_DISTRICT_BOUNDARIES, AMAP_DISTRICT_CELL_DEG)
+
+
+# 天气缓存按 adcode 存储，过期时间跟随预报的 reporttime：缓存到下一次预计发布时刻，
+# 若已超过预计发布时刻仍未更新，则至少间隔 AMAP_WEATHER_MIN_TTL 秒再重新查询
+AMAP_WEATHER_CACHE_SIZE = int(os.getenv("AMAP_WEATHER_CACHE_SIZE", "1000"))
+AMAP_WEATHER_REPORT_INTERVAL = float(os.getenv("AMAP_WEATHER_REPORT_INTERVAL", str(3 * 3600)))
+AMAP_WEATHER_MIN_TTL = float(os.getenv("AMAP_WEATHER_MIN_TTL", "600"))
+weather_cache = TTLCache(AMAP_WEATHER_CACHE_SIZE, AMAP_WEATHER_REPORT_INTERVAL)
+# 已解析过的城市名称/adcode -> 预报实际所属 adcode，使按名称和按 adcode 的请求共享同一缓存项；
+# 键来自任意输入，因此同样使用有容量上限的 LRU，名称与 adcode 的对应关系很少变化，TTL 较长
+AMAP_WEATHER_ALIAS_CACHE_SIZE = int(os.getenv("AMAP_WEATHER_ALIAS_CACHE_SIZE", "10000"))
+AMAP_WEATHER_ALIAS_TTL = float(os.getenv("AMAP_WEATHER_ALIAS_TTL", str(30 * 24 * 3600)))
+weather_aliases = TTLCache(AMAP_WEATHER_ALIAS_CACHE_SIZE, AMAP_WEATHER_ALIAS_TTL)
+
+
+def weather_ttl(reporttime: Optional[str]) -> float:
+    """Seconds until Amap is expected to publish the report following ``reporttime`` (Beijing time)"""
+    try:
+        reported = datetime.datetime.strptime(reporttime, "%Y-%m-%d %H:%M:%S").replace(tzinfo=CHINA_TZ)
+    except (TypeError, ValueError):
+        return AMAP_WEATHER_MIN_TTL
+    return max(reported.timestamp() + AMAP_WEATHER_REPORT_INTERVAL - time.time(), AMAP_WEATHER_MIN_TTL)
+
+
+# 批量地理编码：高德单次最多10个地址 / 20个坐标，分片后并发请求
+AMAP_GEO_BATCH_SIZE = 10
+AMAP_REGEO_BATCH_SIZE = 20
+AMAP_BATCH_CONCURRENCY = int(os.getenv("AMAP_BATCH_CONCURRENCY", "8"))
+# 距离测量：高德单次最多100个起点对1个终点
+AMAP_DISTANCE_MAX_ORIGINS = 100
+AMAP_DISTANCE_CONCURRENCY = int(os.getenv("AMAP_DISTANCE_CONCURRENCY", "10"))
+# 本地直线距离矩阵的单元数（起点数×终点数）上限，整个矩阵在内存中计算并随响应返回
+AMAP_DISTANCE_MATRIX_LOCAL_MAX_CELLS = int(os.getenv("AMAP_DISTANCE_MATRIX_LOCAL_MAX_CELLS", "1000000"))
+# POI 分页：高德每页最多25条、最多100页
+AMAP_PLACE_PAGE_SIZE = 25
+AMAP_PLACE_DEFAULT_PAGE_SIZE = 20
+AMAP_PLACE_MAX_PAGES = 100
+# 周边搜半径取值范围为 0-50000 米，超出时高德改用默认的 3000 米
+AMAP_AROUND_MAX_RADIUS_M = 50000
+AMAP_PLACE_CONCURRENCY = int(os.getenv("AMAP_PLACE_CONCURRENCY", "5"))
+# 多方式路线对比：单个出行方式的超时（秒）
+ROUTE_MODES = ("driving", "walking", "bicycling", "transit")
+AMAP_COMPARE_MODE_TIMEOUT = float(os.getenv("AMAP_COMPARE_MODE_TIMEOUT", "8"))
+# 等时圈：出行方式 -> 距离测量 type、估算最大半径用的速度上限（公里/小时）与初始采样环数
+ISOCHRONE_DISTANCE_TYPES = {"driving": "1", "walking": "3"}
+AMAP_ISOCHRONE_SPEED_KMH = {
+    "driving": float(os.getenv("AMAP_ISOCHRONE_SPEED_KMH_DRIVING", "60")),
+    "walking": float(os.getenv("AMAP_ISOCHRONE_SPEED_KMH_WALKING", "5.4"))
+}
+AMAP_ISOCHRONE_RINGS = int(os.getenv("AMAP_ISOCHRONE_RINGS", "4"))
+# 步行距离测量仅支持 5km 以内
+AMAP_WALKING_DISTANCE_MAX_M = 5000
+# 沿途天气：路线采样间隔（米）与采样点上限（超出时自动放大间隔）
+ROUTE_ENDPOINTS = {
+    "driving": ("/v3/direction/driving", RouteResponse),
+    "walking": ("/v3/direction/walking", RouteResponse),
+    "bicycling": ("/v4/direction/bicycling", BicyclingResponse)
+}
+AMAP_ROUTE_WEATHER_INTERVAL_M = float(os.getenv("AMAP_ROUTE_WEATHER_INTERVAL_M", "10000"))
+AMAP_ROUTE_WEATHER_MAX_SAMPLES = int(os.getenv("AMAP_ROUTE_WEATHER_MAX_SAMPLES", "400"))
+MUNICIPALITY_PREFIXES = ("11", "12", "31", "50")
+
+
+async def gather_limited(limit: int, coros: Iterable[Awaitable[Any]]) -> List[Any]:
+    """Await coroutines concurrently with at most ``limit`` in flight; results keep input order"""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coro: Awaitable[Any]) -> Any:
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(run(coro) for coro in coros))
+
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def split_locations(locations: Union[str, List[str]]) -> List[str]:
+    """Accept either a list of "lng,lat" strings or Amap's "|"-joined form"""
+    if isinstance(locations, str):
+        locations = locations.split("|")
+    return [location.strip() for location in locations if location.strip()]
+
+
+def local_matrix_too_large(origins: List[str], destinations: List[str]) -> Optional[Dict[str, Any]]:
+    """Error dict when an origins x destinations matrix exceeds AMAP_DISTANCE_MATRIX_LOCAL_MAX_CELLS"""
+    cells = len(origins) * len(destinations)
+    if cells > AMAP_DISTANCE_MATRIX_LOCAL_MAX_CELLS:
+        return {"error": f"Distance matrix too large: {len(origins)} x {len(destinations)} = {cells} cells, limit is {AMAP_DISTANCE_MATRIX_LOCAL_MAX_CELLS}"}
+    return None
+
+
+def locations_to_array(locations: List[str]) -> np.ndarray:
+    """Parse "lng,lat" strings into an (N, 2) array of degrees"""
+    return np.array([parse_location(location) for location in locations], dtype=np.float64).reshape(-1, 2)
+
+
+def spherical_distance_matrix(origins: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+    """Great-circle (haversine) distance in metres for every origin/destination pair, shape (N, M)"""
+    origins = np.radians(origins)
+    destinations = np.radians(destinations)
+    dlng = destinations[None, :, 0] - origins[:, None, 0]
+    dlat = destinations[None, :, 1] - origins[:, None, 1]
+    a = np.sin(dlat / 2) ** 2 + np.cos(origins[:, None, 1]) * np.cos(destinations[None, :, 1]) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_m(lng1: float, lat1: float, lng2: float, lat2: float) -> float:
+    """Great-circle distance in metres between two points (scalar version of spherical_distance_matrix)"""
+    lng1, lat1, lng2, lat2 = map(math.radians, (lng1, lat1, lng2, lat2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(a, 1.0)))
+
+
+# 周边搜本地空间索引：网格大小（度）、覆盖圆的有效期（秒）与容量上限
+AMAP_POI_INDEX_CELL_DEG = float(os.getenv("AMAP_POI_INDEX_CELL_DEG", "0.01"))
+AMAP_POI_INDEX_TTL = float(os.getenv("AMAP_POI_INDEX_TTL", "1800"))
+AMAP_POI_INDEX_MAX_POIS = int(os.getenv("AMAP_POI_INDEX_MAX_POIS", "200000"))
+AMAP_POI_INDEX_MAX_SEARCHES = int(os.getenv("AMAP_POI_INDEX_MAX_SEARCHES", "2000"))
+
+
+class PoiSpatialIndex:
+    """Grid index over every POI seen in around searches, plus the circles those searches covered.
+    
+    A POI is tagged with the normalized keywords that returned it and when it was last seen. An
+    around search whose result set was complete (count <= POIs received) records its circle; a later
+    query with the same keywords whose circle lies entirely inside a fresh recorded circle can then
+    be answered from the grid without calling Amap.
+    """
+
+    def __init__(self, cell_deg: float, ttl: float, max_pois: int, max_searches: int):
+        self.cell_deg = cell_deg
+        self.ttl = ttl
+        self.max_pois = max_pois
+        self.max_searches = max_searches
+        self._pois: "OrderedDict[str, Tuple[float, float, Dict[str, Any], Dict[str, float]]]" = OrderedDict()
+        self._cells: Dict[Tuple[int, int], set] = {}
+        self._searches: List[Tuple[float, float, float, str, float]] = []
+        self.local_answers = 0
+        self.api_fallbacks = 0
+
+    def _cell(self, lng: float, lat: float) -> Tuple[int, int]:
+        return int(math.floor(lng / self.cell_deg)), int(math.floor(lat / self.cell_deg))
+
+    def add(self, pois: List[Dict[str, Any]], keywords: str) -> None:
+        now = time.monotonic()
+        for poi in pois:
+            try:
+                lng, lat = parse_location(poi.get("location") or "")
+            except ValueError:
+                continue
+            poi_id = poi.get("id")
+            if not poi_id:
+                continue
+            previous = self._pois.pop(poi_id, None)
+            tags = previous[3] if previous else {}
+            if previous and (previous[0], previous[1]) != (lng, lat):
+                self._cells.get(self._cell(previous[0], previous[1]), set()).discard(poi_id)
+            tags[keywords] = now
+            self._pois[poi_id] = (lng, lat, poi_entry(poi), tags)
+            self._cells.setdefault(self._cell(lng, lat), set()).add(poi_id)
+        while len(self._pois) > self.max_pois:
+            poi_id, (lng, lat, _, _) = self._pois.popitem(last=False)
+            self._cells.get(self._cell(lng, lat), set()).discard(poi_id)
+
+    def record_search(self, lng: float, lat: float, radius: float, keywords: str) -> None:
+        now = time.monotonic()
+        self._searches = [search for search in self._searches if now - search[4] < self.ttl][-(self.max_searches - 1):]
+        self._searches.append((lng, lat, radius, keywords, now))
+
+    def covered(self, lng: float, lat: float, radius: float, keywords: str) -> bool:
+        now = time.monotonic()
+        return any(
+            search_keywords == keywords and now - fetched_at < self.ttl
+            and haversine_m(lng, lat, search_lng, search_lat) + radius <= search_radius
+            for search_lng, search_lat, search_radius, search_keywords, fetched_at in self._searches
+        )
+
+    def query(self, lng: float, lat: float, radius: float, keywords: str) -> List[Dict[str, Any]]:
+        """Fresh POIs tagged with ``keywords`` within ``radius`` metres, nearest first"""
+        now = time.monotonic()
+        dlat = radius / 111320.0
+        dlng = radius / (111320.0 * max(math.cos(math.radians(lat)), 0.01))
+        min_x, min_y = self._cell(lng - dlng, lat - dlat)
+        max_x, max_y = self._cell(lng + dlng, lat + dlat)
+        found = []
+        for x in range(min_x, max_x + 1):
+            for y in range(min_y, max_y + 1):
+                for poi_id in self._cells.get((x, y), ()):
+                    poi_lng, poi_lat, entry, tags = self._pois[poi_id]
+                    if now - tags.get(keywords, -math.inf) >= self.ttl:
+                        continue
+                    distance = haversine_m(lng, lat, poi_lng, poi_lat)
+                    if distance <= radius:
+                        found.append((distance, entry))
+        found.sort(key=lambda item: item[0])
+        return [copy.deepcopy(entry) for _, entry in found]
+
+    def location(self, poi_id: str) -> Optional[Tuple[float, float]]:
+        """Last seen (lng, lat) of an indexed POI"""
+        record = self._pois.get(poi_id)
+        return (record[0], record[1]) if record else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pois": len(self._pois),
+            "searches": len(self._searches),
+            "local_answers": self.local_answers,
+            "api_fallbacks": self.api_fallbacks
+        }
+
+
+poi_index = PoiSpatialIndex(AMAP_POI_INDEX_CELL_DEG, AMAP_POI_INDEX_TTL, AMAP_POI_INDEX_MAX_POIS, AMAP_POI_INDEX_MAX_SEARCHES)
+
+
+def chunked(items: List[Any], size: int) -> List[List[Any]]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def geocode_entry(geo: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "country": geo.get("country"),
+        "province": geo.get("province"),
+        "city": geo.get("city"),
+        "citycode": geo.get("citycode"),
+        "district": geo.get("district"),
+        "street": geo.get("street"),
+        "number": geo.get("number"),
+        "adcode": geo.get("adcode"),
+        "location": geo.get("location"),
+        "level": geo.get("level")
+    }
+
+
+ROUTE_DETAIL_LEVELS = ("summary", "steps", "full")
+# 路线几何：默认的 Douglas-Peucker 简化容差（米）与编码精度（小数位）
+AMAP_GEOMETRY_TOLERANCE_M = float(os.getenv("AMAP_GEOMETRY_TOLERANCE_M", "5"))
+AMAP_GEOMETRY_PRECISION = 6
+
+
+def wants(fields: Optional[List[str]], key: str) -> bool:
+    return not fields or key in fields
+
+
+def project_step(step: RouteStep, detail: str) -> Dict[str, Any]:
+    if detail == "steps":
+        return {
+            "instruction": step.instruction,
+            "distance": step.distance,
+            "duration": step.duration
+        }
+    return {
+        "instruction": step.instruction,
+        "road": step.road,
+        "distance": step.distance,
+        "orientation": step.orientation,
+        "duration": step.duration
+    }
+
+
+def project_path(path: RoutePath, detail: str, fields: Optional[List[str]], keys: Tuple[str, ...] = ("distance", "duration")) -> Dict[str, Any]:
+    """Project a driving/walking/bicycling path straight to the requested detail level and fields"""
+    result = {key: getattr(path, key, None) for key in keys if wants(fields, key)}
+    if detail != "summary" and wants(fields, "steps"):
+        result["steps"] = [project_step(step, detail) for step in path.steps]
+    return result
+
+
+EMPTY_TRANSIT_WALKING = TransitWalking()
+EMPTY_TRANSIT_BUS = TransitBus()
+EMPTY_TRANSIT_STOP = TransitStop()
+EMPTY_RAILWAY = Railway()
+
+
+def transit_lines(transit: TransitPlan) -> List[str]:
+    """Names of the bus/subway lines and trains used by a transit plan, in riding order"""
+    lines = []
+    for segment in transit.segments:
+        for busline in as_struct(segment.bus, EMPTY_TRANSIT_BUS).buslines:
+            lines.append(busline.name)
+        railway_name = as_struct(segment.railway, EMPTY_RAILWAY).name
+        if railway_name:
+            lines.append(railway_name)
+    return lines
+
+
+def project_segment(segment: TransitSegment, detail: str) -> Dict[str, Any]:
+    walking = as_struct(segment.walking, EMPTY_TRANSIT_WALKING)
+    railway = as_struct(segment.railway, EMPTY_RAILWAY)
+    buslines = []
+    for busline in as_struct(segment.bus, EMPTY_TRANSIT_BUS).buslines:
+        line = {
+            "name": busline.name,
+            "departure_stop": {"name": as_struct(busline.departure_stop, EMPTY_TRANSIT_STOP).name},
+            "arrival_stop": {"name": as_struct(busline.arrival_stop, EMPTY_TRANSIT_STOP).name},
+            "distance": busline.distance,
+            "duration": busline.duration
+        }
+        if detail == "full":
+            line["via_stops"] = [{"name": stop.name} for stop in busline.via_stops]
+        buslines.append(line)
+    
+    if detail == "steps":
+        return {
+            "walking": {"distance": walking.distance, "duration": walking.duration},
+            "bus": {"buslines": buslines},
+            "railway": {"name": railway.name, "trip": railway.trip}
+        }
+    return {
+        "walking": {
+            "origin": walking.origin,
+            "destination": walking.destination,
+            "distance": walking.distance,
+            "duration": walking.duration,
+            "steps": [
+                {
+                    "instruction": step.instruction,
+                    "road": step.road,
+                    "distance": step.distance,
+                    "action": step.action,
+                    "assistant_action": step.assistant_action
+                }
+                for step in walking.steps
+            ]
+        },
+        "bus": {"buslines": buslines},
+        "entrance": {"name": as_struct(segment.entrance, EMPTY_TRANSIT_STOP).name},
+        "exit": {"name": as_struct(segment.exit, EMPTY_TRANSIT_STOP).name},
+        "railway": {"name": railway.name, "trip": railway.trip}
+    }
+
+
+def project_transit(transit: TransitPlan, detail: str, fields: Optional[List[str]]) -> Dict[str, Any]:
+    """Project a transit plan: "summary" keeps totals and line names, "steps" adds segments without
+    walking steps or via stops, "full" keeps everything"""
+    result = {key: getattr(transit, key) for key in ("duration", "walking_distance", "cost") if wants(fields, key)}
+    if detail == "summary":
+        if wants(fields, "lines"):
+            result["lines"] = transit_lines(transit)
+    elif wants(fields, "segments"):
+        result["segments"] = [project_segment(segment, detail) for segment in transit.segments]
+    return result
+
+
+def parse_polyline(polyline: Any) -> np.ndarray:
+    """Parse Amap's "lng,lat;lng,lat" polyline text into an (N, 2) array of degrees"""
+    if not isinstance(polyline, str) or not polyline:
+        return np.empty((0, 2), dtype=np.float64)
+    return locations_to_array([point for point in polyline.split(";") if point])
+
+
+def merge_polylines(polylines: Iterable[Any]) -> np.ndarray:
+    """Concatenate step polylines, dropping the repeated vertex where one step ends and the next begins"""
+    parts = [points for points in map(parse_polyline, polylines) if len(points)]
+    if not parts:
+        return np.empty((0, 2), dtype=np.float64)
+    points = np.concatenate(parts)
+    keep = np.ones(len(points), dtype=bool)
+    keep[1:] = np.any(points[1:] != points[:-1], axis=1)
+    return points[keep]
+
+
+def simplify_polyline(points: np.ndarray, tolerance_m: float) -> np.ndarray:
+    """Douglas-Peucker simplification with the tolerance in metres, on a local equirectangular projection"""
+    if len(points) <= 2 or tolerance_m <= 0:
+        return points
+    scale = math.radians(1) * EARTH_RADIUS_M
+    xy = np.column_stack((
+        points[:, 0] * scale * math.cos(math.radians(float(points[:, 1].mean()))),
+        points[:, 1] * scale
+    ))
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = xy[end] - xy[start]
+        offsets = xy[start + 1:end] - xy[start]
+        length = math.hypot(segment[0], segment[1])
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance_m:
+            split = start + 1 + index
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return points[keep]
+
+
+def encode_polyline(points: np.ndarray, precision: int = AMAP_GEOMETRY_PRECISION) -> str:
+    """Encode (lng, lat) points with the Google encoded polyline algorithm (lat/lng order, 10^precision)"""
+    chunks = []
+    previous = (0, 0)
+    for lng, lat in np.round(points * 10 ** precision).astype(np.int64).tolist():
+        for value in (lat - previous[0], lng - previous[1]):
+            value = ~(value << 1) if value < 0 else value << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1F)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        previous = (lat, lng)
+    return "".join(chunks)
+
+
+def build_geometry(polylines: Iterable[Any], tolerance_m: float) -> Dict[str, Any]:
+    """Merge step polylines into one simplified, encoded route geometry"""
+    points = merge_polylines(polylines)
+    simplified = simplify_polyline(points, tolerance_m)
+    return {
+        "encoding": "polyline",
+        "precision": AMAP_GEOMETRY_PRECISION,
+        "tolerance_m": tolerance_m,
+        "points": len(simplified),
+        "raw_points": len(points),
+        "polyline": encode_polyline(simplified)
+    }
+
+
+def path_geometry(path: RoutePath, tolerance_m: float) -> Dict[str, Any]:
+    return build_geometry((step.polyline for step in path.steps), tolerance_m)
+
+
+def transit_geometry(transit: TransitPlan, tolerance_m: float) -> Dict[str, Any]:
+    """Geometry of a transit plan: walking legs and bus/subway lines in riding order"""
+    polylines = []
+    for segment in transit.segments:
+        polylines.extend(step.polyline for step in as_struct(segment.walking, EMPTY_TRANSIT_WALKING).steps)
+        polylines.extend(busline.polyline for busline in as_struct(segment.bus, EMPTY_TRANSIT_BUS).buslines)
+    return build_geometry(polylines, tolerance_m)
+
+
+def poi_entry(poi: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": poi.get("id"),
+        "name": poi.get("name"),
+        "address": poi.get("address"),
+        "typecode": poi.get("typecode")
+    }
+
+
+def poi_detail(poi: Dict[str, Any]) -> Dict[str, Any]:
+    result = {
+        "id": poi.get("id"),
+        "name": poi.get("name"),
+        "location": poi.get("location"),
+        "address": poi.get("address"),
+        "business_area": poi.get("business_area"),
+        "city": poi.get("cityname"),
+        "type": poi.get("type"),
+        "alias": poi.get("alias")
+    }
+    
+    # Add biz_ext data if available
+    if poi.get("biz_ext"):
+        result.update(poi["biz_ext"])
+    return result
+
+
+def remember_pois(pois: List[Dict[str, Any]]) -> None:
+    """Fill the POI detail cache from full_detail (extensions=all) search results; base results lack
+    biz_ext and are not cached, so maps_search_detail never serves a partial entry"""
+    for poi in pois:
+        if poi.get("id") and "biz_ext" in poi:
+            poi_detail_cache.set(poi["id"], poi_detail(poi))
+
+
+async def fetch_place_pages(path: str, params: Dict[str, Any], max_results: int, ctx: Optional[Context] = None) -> Dict[str, Any]:
+    """Collect up to ``max_results`` raw POIs from a paginated v3 place endpoint.
+    
+    The first page is fetched to read ``count``; the remaining pages are fetched concurrently under
+    AMAP_PLACE_CONCURRENCY. Each page is streamed to the client as a progress notification (message =
+    JSON list of POIs) as soon as it arrives; the returned POIs are in page order. Returns the first
+    page's body with "pois" replaced, plus "page_errors" for pages that failed.
+    """
+    first = await amap_get(path, params={**params, "offset": AMAP_PLACE_PAGE_SIZE, "page": 1})
+    if first["status"] != "1":
+        return first
+    
+    pages = {1: (first.get("pois") or [])[:max_results]}
+    total = min(int(first.get("count") or 0), max_results, AMAP_PLACE_PAGE_SIZE * AMAP_PLACE_MAX_PAGES)
+    fetched = len(pages[1])
+    if ctx is not None:
+        await ctx.report_progress(fetched, total, json.dumps([poi_entry(poi) for poi in pages[1]], ensure_ascii=False))
+    
+    semaphore = asyncio.Semaphore(AMAP_PLACE_CONCURRENCY)
+    page_errors = []
+
+    async def fetch(page: int) -> Tuple[int, List[Dict[str, Any]]]:
+        async with semaphore:
+            try:
+                data = await amap_get(path, params={**params, "offset": AMAP_PLACE_PAGE_SIZE, "page": page})
+            except httpx.HTTPError as e:
+                page_errors.append({"page": page, "error": f"Request failed: {str(e)}"})
+                return page, []
+        if data["status"] != "1":
+            page_errors.append({"page": page, "error": data.get("info") or data.get("infocode")})
+            return page, []
+        return page, data.get("pois") or []
+
+    if fetched:
+        for next_page in asyncio.as_completed([fetch(page) for page in range(2, math.ceil(total / AMAP_PLACE_PAGE_SIZE) + 1)]):
+            page, pois = await next_page
+            pages[page] = pois
+            fetched += len(pois)
+            if ctx is not None:
+                await ctx.report_progress(min(fetched, total), total, json.dumps([poi_entry(poi) for poi in pois], ensure_ascii=False))
+    
+    pois = [poi for page in sorted(pages) for poi in pages[page]][:max_results]
+    return {**first, "pois": pois, "page_errors": sorted(page_errors, key=lambda error: error["page"])}
+
+
+def as_number(value: Any) -> Optional[float]:
+    """Amap sends numbers as strings and missing values as []; return a float or None"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def summarize_route(mode: str, route_result: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce a summary-level route tool result to one comparable row: distance (m), duration (s), cost (yuan), walking distance (m)"""
+    if "error" in route_result:
+        return {"mode": mode, "error": route_result["error"]}
+    if mode == "transit":
+        transits = route_result["route"].get("transits") or []
+        if not transits:
+            return {"mode": mode, "error": "No transit plan found"}
+        best = min(transits, key=lambda transit: as_number(transit.get("duration")) or math.inf)
+        return {
+            "mode": mode,
+            "distance": as_number(route_result["route"].get("distance")),
+            "duration": as_number(best.get("duration")),
+            "cost": as_number(best.get("cost")),
+            "walking_distance": as_number(best.get("walking_distance")),
+            "lines": best.get("lines")
+        }
+    paths = (route_result.get("route") or route_result.get("data") or {}).get("paths") or []
+    if not paths:
+        return {"mode": mode, "error": "No route found"}
+    distance = as_number(paths[0].get("distance"))
+    return {
+        "mode": mode,
+        "distance": distance,
+        "duration": as_number(paths[0].get("duration")),
+        "cost": as_number(paths[0].get("tolls")) or 0.0,
+        "walking_distance": distance if mode == "walking" else 0.0
+    }
+
+
+def regeocode_component(address_component: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "province": address_component["province"],
+        "city": address_component["city"],
+        "district": address_component["district"],
+        "adcode": address_component.get("adcode"),
+        "citycode": address_component.get("citycode")
+    }
+
+
+async def distance_matrix(origins: List[str], destinations: List[str], type: str = "1") -> Dict[str, Any]:
+    """Dense origin x destination distance (m) / duration (s) matrices built from /v3/distance.
+    
+    Each request carries up to AMAP_DISTANCE_MAX_ORIGINS origins and one destination; requests run
+    concurrently under AMAP_DISTANCE_CONCURRENCY. Cells whose request failed stay None and the
+    failure is listed in "errors". type "0" is computed locally.
+    """
+    if type == "0":
+        distances = spherical_distance_matrix(locations_to_array(origins), locations_to_array(destinations))
+        return {
+            "distance": np.rint(distances).astype(np.int64).tolist(),
+            "duration": [[0] * len(destinations) for _ in origins],
+            "errors": [],
+            "requests": 0
+        }
+
+    distance: List[List[Optional[int]]] = [[None] * len(destinations) for _ in origins]
+    duration: List[List[Optional[int]]] = [[None] * len(destinations) for _ in origins]
+    errors: List[Dict[str, Any]] = []
+    origin_chunks = chunked(list(range(len(origins))), AMAP_DISTANCE_MAX_ORIGINS)
+
+    async def fetch(dest_index: int, origin_indexes: List[int]) -> None:
+        span = {"destination": dest_index, "origins": [origin_indexes[0], origin_indexes[-1]]}
+        try:
+            data = await amap_get(
+                "/v3/distance",
+                params={
+                    "origins": "|".join(origins[i] for i in origin_indexes),
+                    "destination": destinations[dest_index],
+                    "type": type
+                }
+            )
+        except httpx.HTTPError as e:
+            errors.append({**span, "error": f"Request failed: {str(e)}"})
+            return
+        if data["status"] != "1":
+            errors.append({**span, "error": f"Direction Distance failed: {data.get('info') or data.get('infocode')}"})
+            return
+        for result in data.get("results", []):
+            i = origin_indexes[int(result["origin_id"]) - 1]
+            if result.get("distance") not in (None, ""):
+                distance[i][dest_index] = int(float(result["distance"]))
+            if result.get("duration") not in (None, ""):
+                duration[i][dest_index] = int(float(result["duration"]))
+
+    await gather_limited(AMAP_DISTANCE_CONCURRENCY, (
+        fetch(dest_index, origin_indexes)
+        for dest_index in range(len(destinations))
+        for origin_indexes in origin_chunks
+    ))
+    return {
+        "distance": distance,
+        "duration": duration,
+        "errors": errors,
+        "requests": len(destinations) * len(origin_chunks)
+    }
+
+
+def offset_location(lng: float, lat: float, bearing_deg: float, distance_m: float) -> Tuple[float, float]:
+    """Point ``distance_m`` metres from (lng, lat) along ``bearing_deg`` (clockwise from north), local flat-earth approximation"""
+    bearing = math.radians(bearing_deg)
+    dlat = distance_m * math.cos(bearing) / EARTH_RADIUS_M
+    dlng = distance_m * math.sin(bearing) / (EARTH_RADIUS_M * math.cos(math.radians(lat)))
+    return lng + math.degrees(dlng), lat + math.degrees(dlat)
+
+
+def sample_polyline(points: np.ndarray, interval_m: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Points every ``interval_m`` metres along a polyline (always including both ends) and their offsets from the start"""
+    if len(points) < 2:
+        return points, np.zeros(len(points))
+    lng, lat = np.radians(points[:, 0]), np.radians(points[:, 1])
+    a = np.sin(np.diff(lat) / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lng) / 2) ** 2
+    segments = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    cumulative = np.concatenate(([0.0], np.cumsum(segments)))
+    offsets = np.append(np.arange(0.0, cumulative[-1], interval_m), cumulative[-1])
+    samples = np.column_stack((np.interp(offsets, cumulative, points[:, 0]), np.interp(offsets, cumulative, points[:, 1])))
+    return samples, offsets
+
+
+def city_adcode(adcode: Any) -> Optional[str]:
+    """Collapse a district adcode to its city: municipalities to the province code, county-level cities
+    administered directly by a province (xx90xx) stay as they are"""
+    if not isinstance(adcode, str) or len(adcode) != 6 or not adcode.isdigit():
+        return None
+    if adcode[:2] in MUNICIPALITY_PREFIXES:
+        return adcode[:2] + "0000"
+    if adcode[2:4] == "90":
+        return adcode
+    return adcode[:4] + "00"
+
+
+def format_location(lng: float, lat: float) -> str:
+    return f"{lng:.6f},{lat:.6f}"
+
+
+def polygon_contains(polygon: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """Even-odd ray cast of (N, 2) ``points`` against one (M, 2) polygon ring"""
+    x1, y1 = polygon[:, 0], polygon[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+    x, y = points[:, 0:1], points[:, 1:2]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossing = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    return np.count_nonzero(((y1 > y) != (y2 > y)) & (x < crossing), axis=1) % 2 == 1
+
+
+def polygon_area_m2(polygon: np.ndarray) -> float:
+    """Shoelace area of a small lng/lat polygon on a local equirectangular projection"""
+    if len(polygon) < 3:
+        return 0.0
+    scale = math.radians(1) * EARTH_RADIUS_M
+    x = polygon[:, 0] * scale * math.cos(math.radians(float(polygon[:, 1].mean())))
+    y = polygon[:, 1] * scale
+    return abs(float(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))) / 2
+
 
 mcp = FastMCP("amap-maps")
 
+async def regeocode_many(locations: List[str]) -> List[Dict[str, Any]]:
+    """Reverse-geocode locations to full components (province, city, district, adcode, citycode), in input order.
+    
+    The offline district index answers first, then the geocode cache; the rest go to Amap in
+    concurrent batches of AMAP_REGEO_BATCH_SIZE. Failures become {"location", "error"} entries.
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(locations)
+    pending = []
+    for index, (location, component) in enumerate(zip(locations, district_index.lookup_many(locations))):
+        cache_key = regeo_cache_key(location)
+        if cache_key is None:
+            results[index] = {"location": location, "error": "Invalid location, expected \"longitude,latitude\""}
+            continue
+        if component is None:
+            component = geocode_cache.get(cache_key)
+        if component is not None:
+            results[index] = {"location": location, **component}
+        else:
+            pending.append(index)
+
+    async def fetch_chunk(indexes: List[int]) -> None:
+        try:
+            data = await amap_get(
+                "/v3/geocode/regeo",
+                params={"location": "|".join(locations[i] for i in indexes), "batch": "true"}
+            )
+        except httpx.HTTPError as e:
+            for i in indexes:
+                results[i] = {"location": locations[i], "error": f"Request failed: {str(e)}"}
+            return
+        if data["status"] != "1":
+            for i in indexes:
+                results[i] = {"location": locations[i], "error": f"RGeocoding failed: {data.get('info') or data.get('infocode')}"}
+            return
+        regeocodes = data.get("regeocodes") or []
+        entries = []
+        for offset, i in enumerate(indexes):
+            regeocode = regeocodes[offset] if offset < len(regeocodes) else None
+            if not regeocode or not regeocode.get("addressComponent"):
+                results[i] = {"location": locations[i], "error": "No regeocoding result"}
+                continue
+            component = regeocode_component(regeocode["addressComponent"])
+            entries.append((regeo_cache_key(locations[i]), component))
+            results[i] = {"location": locations[i], **component}
+        await geocode_cache.set_many(entries)
+
+    await gather_limited(AMAP_BATCH_CONCURRENCY, (fetch_chunk(chunk) for chunk in chunked(pending, AMAP_REGEO_BATCH_SIZE)))
+    return results
+
+
+async def resolve_address(address: str, city: Optional[str], label: str) -> Dict[str, Any]:
+    """Geocode an address and return its best match, or an {"error": ...} dict naming the endpoint"""
+    result = await maps_geo(address, city)
+    if "error" in result:
+        return {"error": f"Failed to geocode {label} address: {result['error']}"}
+    
+    if not result.get("return"):
+        return {"error": f"No geocoding results found for {label} address"}
+    
+    geocode = result["return"][0]
+    if not geocode.get("location"):
+        return {"error": f"Could not extract coordinates from {label} geocoding result"}
+    return geocode
+
+async def route_by_address(plan_route: Any, origin_address: str, destination_address: str, origin_city: Optional[str], destination_city: Optional[str], **route_kwargs: Any) -> Dict[str, Any]:
+    """Shared pipeline behind the *_by_address tools.
+    
+    Both endpoints are geocoded concurrently, then ``plan_route`` (one of the *_by_coordinates tools)
+    is called with the resolved coordinates. Successful results carry the resolved addresses and
+    per-stage timings in milliseconds.
+    """
+    started = time.perf_counter()
+    origin, destination = await asyncio.gather(
+        resolve_address(origin_address, origin_city, "origin"),
+        resolve_address(destination_address, destination_city, "destination")
+    )
+    geocoded = time.perf_counter()
+    for endpoint in (origin, destination):
+        if "error" in endpoint:
+            return endpoint
+    
+    route_result = await plan_route(origin["location"], destination["location"], **route_kwargs)
+    finished = time.perf_counter()
+    
+    if "error" not in route_result:
+        route_result["addresses"] = {
+            "origin": {
+                "address": origin_address,
+                "coordinates": origin["location"]
+            },
+            "destination": {
+                "address": destination_address,
+                "coordinates": destination["location"]
+            }
+        }
+        route_result["timing"] = {
+            "geocode_ms": round((geocoded - started) * 1000, 1),
+            "route_ms": round((finished - geocoded) * 1000, 1),
+            "total_ms": round((finished - started) * 1000, 1)
+        }
+    return route_result
+
 @mcp.tool()
-def maps_regeocode(location: str) -> Dict[str, Any]:
+async def maps_regeocode(location: str) -> Dict[str, Any]:
     """将一个高德经纬度坐标转换为行政区划地址信息"""
+    component = district_index.lookup(location)
+    if component is not None:
+        return {key: component[key] for key in ("province", "city", "district")}
+    cache_key = regeo_cache_key(location)
+    component = geocode_cache.get(cache_key) if cache_key else None
+    if component is not None:
+        return {key: component[key] for key in ("province", "city", "district")}
     try:
-        response = requests.get(
-            "https://restapi.amap.com/v3/geocode/regeo",
+        data = await amap_get(
+            "/v3/geocode/regeo",
             params={
-                "key": AMAP_MAPS_API_KEY,
                 "location": location
             }
         )
-        response.raise_for_status()
-        data = response.json()
         
         if data["status"] != "1":
             return {"error": f"RGeocoding failed: {data.get('info') or data.get('infocode')}"}
             
-        return {
-            "province": data["regeocode"]["addressComponent"]["province"],
-            "city": data["regeocode"]["addressComponent"]["city"],
-            "district": data["regeocode"]["addressComponent"]["district"]
-        }
-    except requests.exceptions.RequestException as e:
+        component = regeocode_component(data["regeocode"]["addressComponent"])
+        if cache_key:
+            await geocode_cache.set(cache_key, component)
+        return {key: component[key] for key in ("province", "city", "district")}
+    except httpx.HTTPError as e:
         return {"error": f"Request failed: {str(e)}"}
 
 @mcp.tool()
-def maps_geo(address: str, city: Optional[str] = None) -> Dict[str, Any]:
+async def maps_geo(address: str, city: Optional[str] = None) -> Dict[str, Any]:
     """将详细的结构化地址转换为经纬度坐标。支持对地标性名胜景区、建筑物名称解析为经纬度坐标"""
+    cache_key = geo_cache_key(address, city)
+    cached = geocode_cache.get(cache_key)
+    if cached is not None:
+        return cached
     try:
         params = {
-            "key": AMAP_MAPS_API_KEY,
             "address": address
         }
         if city:
             params["city"] = city
             
-        response = requests.get(
-            "https://restapi.amap.com/v3/geocode/geo",
+        data = await amap_get(
+            "/v3/geocode/geo",
             params=params
         )
-        response.raise_for_status()
-        data = response.json()
         
         if data["status"] != "1":
             return {"error": f"Geocoding failed: {data.get('info') or data.get('infocode')}"}
@@ -66,62 +1997,129 @@ def maps_geo(address: str, city: Optional[str] = None) -> Dict[str, Any]:
         geocodes = data.get("geocodes", [])
         results = []
         for geo in geocodes:
-            results.append({
-                "country": geo.get("country"),
-                "province": geo.get("province"),
-                "city": geo.get("city"),
-                "citycode": geo.get("citycode"),
-                "district": geo.get("district"),
-                "street": geo.get("street"),
-                "number": geo.get("number"),
-                "adcode": geo.get("adcode"),
-                "location": geo.get("location"),
-                "level": geo.get("level")
-            })
+            results.append(geocode_entry(geo))
+        await geocode_cache.set(cache_key, {"return": results})
         return {"return": results}
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         return {"error": f"Request failed: {str(e)}"}
 
 @mcp.tool()
-def maps_ip_location(ip: str) -> Dict[str, Any]:
+async def maps_geo_batch(addresses: List[str], city: Optional[str] = None) -> Dict[str, Any]:
+    """批量地理编码：将任意数量的结构化地址转换为经纬度坐标，结果与输入顺序一致，单条失败不影响其他地址
+    
+    Args:
+        addresses (List[str]): 地址列表 (例如：["北京市朝阳区阜通东大街6号", "北京市海淀区上地十街10号"])
+        city (Optional[str]): 可选的城市名称，作用于全部地址
+        
+    Returns:
+        Dict[str, Any]: {"results": [...]}，每项为 {"address", "return": [...]} 或 {"address", "error"}
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(addresses)
+    pending = []
+    for index, address in enumerate(addresses):
+        cached = geocode_cache.get(geo_cache_key(address, city))
+        if cached is not None:
+            results[index] = {"address": address, **cached}
+        else:
+            pending.append(index)
+
+    async def fetch_chunk(indexes: List[int]) -> None:
+        params = {"address": "|".join(addresses[i] for i in indexes), "batch": "true"}
+        if city:
+            params["city"] = city
+        try:
+            data = await amap_get("/v3/geocode/geo", params=params)
+        except httpx.HTTPError as e:
+            for i in indexes:
+                results[i] = {"address": addresses[i], "error": f"Request failed: {str(e)}"}
+            return
+        if data["status"] != "1":
+            for i in indexes:
+                results[i] = {"address": addresses[i], "error": f"Geocoding failed: {data.get('info') or data.get('infocode')}"}
+            return
+        geocodes = data.get("geocodes") or []
+        entries = []
+        for offset, i in enumerate(indexes):
+            geo = geocodes[offset] if offset < len(geocodes) else None
+            if not geo or not geo.get("location"):
+                results[i] = {"address": addresses[i], "error": "No geocoding results found"}
+                continue
+            entry = {"return": [geocode_entry(geo)]}
+            entries.append((geo_cache_key(addresses[i], city), entry))
+            results[i] = {"address": addresses[i], **entry}
+        await geocode_cache.set_many(entries)
+
+    await gather_limited(AMAP_BATCH_CONCURRENCY, (fetch_chunk(chunk) for chunk in chunked(pending, AMAP_GEO_BATCH_SIZE)))
+    return {"results": results}
+
+@mcp.tool()
+async def maps_regeocode_batch(locations: List[str]) -> Dict[str, Any]:
+    """批量逆地理编码：将任意数量的高德经纬度坐标转换为行政区划地址信息，结果与输入顺序一致，单条失败不影响其他坐标
+    
+    Args:
+        locations (List[str]): 坐标列表，格式为"经度,纬度" (例如：["116.434307,39.90909"])
+        
+    Returns:
+        Dict[str, Any]: {"results": [...]}，每项为 {"location", "province", "city", "district"} 或 {"location", "error"}
+    """
+    results = await regeocode_many(locations)
+    return {
+        "results": [
+            result if "error" in result else {key: result[key] for key in ("location", "province", "city", "district")}
+            for result in results
+        ]
+    }
+
+@mcp.tool()
+async def maps_ip_location(ip: str) -> Dict[str, Any]:
     """IP 定位根据用户输入的 IP 地址，定位 IP 的所在位置"""
+    cached = ip_cache.get(ip)
+    if cached is not None:
+        return cached
     try:
-        response = requests.get(
-            "https://restapi.amap.com/v3/ip",
+        data = await amap_get(
+            "/v3/ip",
             params={
-                "key": AMAP_MAPS_API_KEY,
                 "ip": ip
             }
         )
-        response.raise_for_status()
-        data = response.json()
         
         if data["status"] != "1":
             return {"error": f"IP Location failed: {data.get('info') or data.get('infocode')}"}
             
-        return {
+        result = {
             "province": data.get("province"),
             "city": data.get("city"),
             "adcode": data.get("adcode"),
             "rectangle": data.get("rectangle")
         }
-    except requests.exceptions.RequestException as e:
+        # 局域网/无法识别的IP返回空值，不缓存
+        if all(isinstance(value, str) and value for value in result.values()):
+            ip_cache.set(ip, (result["province"], result["city"], result["adcode"], result["rectangle"]))
+        return result
+    except httpx.HTTPError as e:
         return {"error": f"Request failed: {str(e)}"}
 
 @mcp.tool()
-def maps_weather(city: str) -> Dict[str, Any]:
+async def maps_weather(city: str) -> Dict[str, Any]:
     """根据城市名称或者标准adcode查询指定城市的天气"""
+    entry = adcode_index.lookup(city)
+    if entry:
+        city = entry["adcode"]
+    query = normalize_text(city)
+    adcode = weather_aliases.get(query) or (query if query.isdigit() else None)
+    if adcode:
+        cached = weather_cache.get(adcode)
+        if cached is not None:
+            return copy.deepcopy(cached)
     try:
-        response = requests.get(
-            "https://restapi.amap.com/v3/weather/weatherInfo",
+        data = await amap_get(
+            "/v3/weather/weatherInfo",
             params={
-                "key": AMAP_MAPS_API_KEY,
                 "city": city,
                 "extensions": "all"
             }
         )
-        response.raise_for_status()
-        data = response.json()
         
         if data["status"] != "1":
             return {"error": f"Get weather failed: {data.get('info') or data.get('infocode')}"}
@@ -130,15 +2128,21 @@ def maps_weather(city: str) -> Dict[str, Any]:
         if not forecasts:
             return {"error": "No forecast data available"}
             
-        return {
+        result = {
             "city": forecasts[0]["city"],
             "forecasts": forecasts[0]["casts"]
         }
-    except requests.exceptions.RequestException as e:
+        resolved_adcode = forecasts[0].get("adcode")
+        if resolved_adcode:
+            weather_aliases.set(query, resolved_adcode)
+            weather_aliases.set(resolved_adcode, resolved_adcode)
+            weather_cache.set(resolved_adcode, copy.deepcopy(result), ttl=weather_ttl(forecasts[0].get("reporttime")))
+        return result
+    except httpx.HTTPError as e:
         return {"error": f"Request failed: {str(e)}"}
 
 @mcp.tool()
-def maps_bicycling_by_address(origin_address: str, destination_address: str, origin_city: Optional[str] = None, destination_city: Optional[str] = None) -> Dict[str, Any]:
+async def maps_bicycling_by_address(origin_address: str, destination_address: str, origin_city: Optional[str] = None, destination_city: Optional[str] = None, detail: str = "full", fields: Optional[List[str]] = None, geometry: bool = False, tolerance: float = AMAP_GEOMETRY_TOLERANCE_M) -> Dict[str, Any]:
     """Plans a bicycle route between two locations using addresses. Unless you have a specific reason to use coordinates, it's recommended to use this tool.
     
     Args:
@@ -146,112 +2150,73 @@ def maps_bicycling_by_address(origin_address: str, destination_address: str, ori
         destination_address (str): Ending point address (e.g. "北京市海淀区上地十街10号")
         origin_city (Optional[str]): Optional city name for the origin address to improve geocoding accuracy
         destination_city (Optional[str]): Optional city name for the destination address to improve geocoding accuracy
+        detail (str): "summary" (distance and duration only), "steps" (adds brief turn-by-turn steps) or "full" (default, every step field)
+        fields (Optional[List[str]]): Optional path-level fields to keep, e.g. ["distance", "duration"]
+        geometry (bool): Also return each path's geometry, merged across steps, simplified and encoded as a polyline string (default False)
+        tolerance (float): Simplification tolerance in metres for the geometry
         
     Returns:
         Dict[str, Any]: Route information including distance, duration, and turn-by-turn instructions.
         Considers bridges, one-way streets, and road closures. Supports routes up to 500km.
     """
     try:
-        # Convert origin address to coordinates
-        origin_result = maps_geo(origin_address, origin_city)
-        if "error" in origin_result:
-            return {"error": f"Failed to geocode origin address: {origin_result['error']}"}
-        
-        if not origin_result.get("return") or not origin_result["return"]:
-            return {"error": "No geocoding results found for origin address"}
-        
-        origin_location = origin_result["return"][0].get("location")
-        if not origin_location:
-            return {"error": "Could not extract coordinates from origin geocoding result"}
-        
-        # Convert destination address to coordinates
-        destination_result = maps_geo(destination_address, destination_city)
-        if "error" in destination_result:
-            return {"error": f"Failed to geocode destination address: {destination_result['error']}"}
-        
-        if not destination_result.get("return") or not destination_result["return"]:
-            return {"error": "No geocoding results found for destination address"}
-        
-        destination_location = destination_result["return"][0].get("location")
-        if not destination_location:
-            return {"error": "Could not extract coordinates from destination geocoding result"}
-        
-        # Use the coordinates to plan the bicycle route
-        route_result = maps_bicycling_by_coordinates(origin_location, destination_location)
-        
-        # Add address information to the result
-        if "error" not in route_result:
-            route_result["addresses"] = {
-                "origin": {
-                    "address": origin_address,
-                    "coordinates": origin_location
-                },
-                "destination": {
-                    "address": destination_address,
-                    "coordinates": destination_location
-                }
-            }
-        
-        return route_result
+        return await route_by_address(
+            maps_bicycling_by_coordinates,
+            origin_address, destination_address, origin_city, destination_city,
+            detail=detail, fields=fields, geometry=geometry, tolerance=tolerance
+        )
     except Exception as e:
         return {"error": f"Route planning failed: {str(e)}"}
     
 @mcp.tool()
-def maps_bicycling_by_coordinates(origin_coordinates: str, destination_coordinates: str) -> Dict[str, Any]:
+async def maps_bicycling_by_coordinates(origin_coordinates: str, destination_coordinates: str, detail: str = "full", fields: Optional[List[str]] = None, geometry: bool = False, tolerance: float = AMAP_GEOMETRY_TOLERANCE_M) -> Dict[str, Any]:
     """Plans a bicycle route between two coordinates.
     
     Args:
         origin_coordinates (str): Starting point coordinates in the format "longitude,latitude" (e.g. "116.434307,39.90909")
         destination_coordinates (str): Ending point coordinates in the format "longitude,latitude" (e.g. "116.434307,39.90909")
+        detail (str): "summary" (distance and duration only), "steps" (adds brief turn-by-turn steps) or "full" (default, every step field)
+        fields (Optional[List[str]]): Optional path-level fields to keep, e.g. ["distance", "duration"]
+        geometry (bool): Also return each path's geometry, merged across steps, simplified and encoded as a polyline string (default False)
+        tolerance (float): Simplification tolerance in metres for the geometry
         
     Returns:
         Dict[str, Any]: Route information including distance, duration, and turn-by-turn instructions.
         Considers bridges, one-way streets, and road closures. Supports routes up to 500km.
     """
+    if detail not in ROUTE_DETAIL_LEVELS:
+        return {"error": f"Unsupported detail level: {detail}, expected one of {', '.join(ROUTE_DETAIL_LEVELS)}"}
     try:
-        response = requests.get(
-            "https://restapi.amap.com/v4/direction/bicycling",
+        data = await cached_route(
+            "bicycling",
+            "/v4/direction/bicycling",
             params={
-                "key": AMAP_MAPS_API_KEY,
                 "origin": origin_coordinates,
                 "destination": destination_coordinates
-            }
+            },
+            decode_type=BicyclingResponse
         )
-        response.raise_for_status()
-        data = response.json()
         
-        if data.get("errcode") != 0:
-            return {"error": f"Direction bicycling failed: {data.get('info') or data.get('infocode')}"}
+        if data.errcode != 0:
+            return {"error": f"Direction bicycling failed: {data.errmsg or data.errcode}"}
             
-        paths = []
-        for path in data["data"]["paths"]:
-            steps = []
-            for step in path["steps"]:
-                steps.append({
-                    "instruction": step.get("instruction"),
-                    "road": step.get("road"),
-                    "distance": step.get("distance"),
-                    "orientation": step.get("orientation"),
-                    "duration": step.get("duration")
-                })
-            paths.append({
-                "distance": path.get("distance"),
-                "duration": path.get("duration"),
-                "steps": steps
-            })
+        paths = [project_path(path, detail, fields) for path in data.data.paths]
+        if geometry:
+            for projected, path in zip(paths, data.data.paths):
+                projected["geometry"] = path_geometry(path, tolerance)
             
         return {
             "data": {
-                "origin": data["data"]["origin"],
-                "destination": data["data"]["destination"],
+                "origin": data.data.origin,
+                "destination": data.data.destination,
                 "paths": paths
             }
         }
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         return {"error": f"Request failed: {str(e)}"}
 
 @mcp.tool()
-def maps_direction_walking_by_address(origin_address: str, destination_address: str, origin_city: Optional[str] = None, destination_city: Optional[str] = None) -> Dict[str, Any]:
+async def maps_direction_walking_by_address(origin_address: str, destination_address: str, origin_city: Optional[str] = None, destination_city: Optional[str] = None, detail: str = "full", fields: Optional[List[str]] = None, geometry: bool = False, tolerance: float = AMAP_GEOMETRY_TOLERANCE_M) -> Dict[str, Any]:
     """Plans a walking route between two locations using addresses. Unless you have a specific reason to use coordinates, it's recommended to use this tool.
     
     Args:
@@ -259,111 +2224,72 @@ def maps_direction_walking_by_address(origin_address: str, destination_address:
         destination_address (str): Ending point address (e.g. "北京市海淀区上地十街10号")
         origin_city (Optional[str]): Optional city name for the origin address to improve geocoding accuracy
         destination_city (Optional[str]): Optional city name for the destination address to improve geocoding accuracy
+        detail (str): "summary" (distance and duration only), "steps" (adds brief turn-by-turn steps) or "full" (default, every step field)
+        fields (Optional[List[str]]): Optional path-level fields to keep, e.g. ["distance", "duration"]
+        geometry (bool): Also return each path's geometry, merged across steps, simplified and encoded as a polyline string (default False)
+        tolerance (float): Simplification tolerance in metres for the geometry
         
     Returns:
         Dict[str, Any]: Route information including distance, duration, and turn-by-turn instructions.
         Supports routes up to 100km.
     """
     try:
-        # Convert origin address to coordinates
-        origin_result = maps_geo(origin_address, origin_city)
-        if "error" in origin_result:
-            return {"error": f"Failed to geocode origin address: {origin_result['error']}"}
-        
-        if not origin_result.get("return") or not origin_result["return"]:
-            return {"error": "No geocoding results found for origin address"}
-        
-        origin_location = origin_result["return"][0].get("location")
-        if not origin_location:
-            return {"error": "Could not extract coordinates from origin geocoding result"}
-        
-        # Convert destination address to coordinates
-        destination_result = maps_geo(destination_address, destination_city)
-        if "error" in destination_result:
-            return {"error": f"Failed to geocode destination address: {destination_result['error']}"}
-        
-        if not destination_result.get("return") or not destination_result["return"]:
-            return {"error": "No geocoding results found for destination address"}
-        
-        destination_location = destination_result["return"][0].get("location")
-        if not destination_location:
-            return {"error": "Could not extract coordinates from destination geocoding result"}
-        
-        # Use the coordinates to plan the walking route
-        route_result = maps_direction_walking_by_coordinates(origin_location, destination_location)
-        
-        # Add address information to the result
-        if "error" not in route_result:
-            route_result["addresses"] = {
-                "origin": {
-                    "address": origin_address,
-                    "coordinates": origin_location
-                },
-                "destination": {
-                    "address": destination_address,
-                    "coordinates": destination_location
-                }
-            }
-        
-        return route_result
+        return await route_by_address(
+            maps_direction_walking_by_coordinates,
+            origin_address, destination_address, origin_city, destination_city,
+            detail=detail, fields=fields, geometry=geometry, tolerance=tolerance
+        )
     except Exception as e:
         return {"error": f"Route planning failed: {str(e)}"}
 
 @mcp.tool()
-def maps_direction_walking_by_coordinates(origin: str, destination: str) -> Dict[str, Any]:
+async def maps_direction_walking_by_coordinates(origin: str, destination: str, detail: str = "full", fields: Optional[List[str]] = None, geometry: bool = False, tolerance: float = AMAP_GEOMETRY_TOLERANCE_M) -> Dict[str, Any]:
     """步行路径规划 API 可以根据输入起点终点经纬度坐标规划100km 以内的步行通勤方案，并且返回通勤方案的数据
     
     Args:
         origin (str): 起点经纬度坐标，格式为"经度,纬度" (例如："116.434307,39.90909")
         destination (str): 终点经纬度坐标，格式为"经度,纬度" (例如："116.434307,39.90909")
+        detail (str): 返回详细程度："summary" 仅距离与时长，"steps" 附带精简导航步骤，"full"（默认）返回全部字段
+        fields (Optional[List[str]]): 可选，仅保留的路线字段，例如 ["distance", "duration"]
+        geometry (bool): 是否返回路线几何（合并各步骤坐标串，Douglas-Peucker 简化后编码为 encoded polyline），默认 False
+        tolerance (float): 几何简化容差（米）
         
     Returns:
         Dict[str, Any]: 包含距离、时长和详细导航信息的路线数据
     """
+    if detail not in ROUTE_DETAIL_LEVELS:
+        return {"error": f"Unsupported detail level: {detail}, expected one of {', '.join(ROUTE_DETAIL_LEVELS)}"}
     try:
-        response = requests.get(
-            "https://restapi.amap.com/v3/direction/walking",
+        data = await cached_route(
+            "walking",
+            "/v3/direction/walking",
             params={
-                "key": AMAP_MAPS_API_KEY,
                 "origin": origin,
                 "destination": destination
-            }
+            },
+            decode_type=RouteResponse
         )
-        response.raise_for_status()
-        data = response.json()
         
-        if data["status"] != "1":
-            return {"error": f"Direction Walking failed: {data.get('info') or data.get('infocode')}"}
+        if data.status != "1":
+            return {"error": f"Direction Walking failed: {data.info or data.infocode}"}
             
-        paths = []
-        for path in data["route"]["paths"]:
-            steps = []
-            for step in path["steps"]:
-                steps.append({
-                    "instruction": step.get("instruction"),
-                    "road": step.get("road"),
-                    "distance": step.get("distance"),
-                    "orientation": step.get("orientation"),
-                    "duration": step.get("duration")
-                })
-            paths.append({
-                "distance": path.get("distance"),
-                "duration": path.get("duration"),
-                "steps": steps
-            })
+        paths = [project_path(path, detail, fields) for path in data.route.paths]
+        if geometry:
+            for projected, path in zip(paths, data.route.paths):
+                projected["geometry"] = path_geometry(path, tolerance)
             
         return {
             "route": {
-                "origin": data["route"]["origin"],
-                "destination": data["route"]["destination"],
+                "origin": data.route.origin,
+                "destination": data.route.destination,
                 "paths": paths
             }
         }
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         return {"error": f"Request failed: {str(e)}"}
 
 @mcp.tool()
-def maps_direction_driving_by_address(origin_address: str, destination_address: str, origin_city: Optional[str] = None, destination_city: Optional[str] = None) -> Dict[str, Any]:
+async def maps_direction_driving_by_address(origin_address: str, destination_address: str, origin_city: Optional[str] = None, destination_city: Optional[str] = None, detail: str = "full", fields: Optional[List[str]] = None, geometry: bool = False, tolerance: float = AMAP_GEOMETRY_TOLERANCE_M) -> Dict[str, Any]:
     """Plans a driving route between two locations using addresses. Unless you have a specific reason to use coordinates, it's recommended to use this tool.
     
     Args:
@@ -371,112 +2297,73 @@ def maps_direction_driving_by_address(origin_address: str, destination_address:
         destination_address (str): Ending point address (e.g. "北京市海淀区上地十街10号")
         origin_city (Optional[str]): Optional city name for the origin address to improve geocoding accuracy
         destination_city (Optional[str]): Optional city name for the destination address to improve geocoding accuracy
+        detail (str): "summary" (distance and duration only), "steps" (adds brief turn-by-turn steps) or "full" (default, every step field)
+        fields (Optional[List[str]]): Optional path-level fields to keep, e.g. ["distance", "duration"]
+        geometry (bool): Also return each path's geometry, merged across steps, simplified and encoded as a polyline string (default False)
+        tolerance (float): Simplification tolerance in metres for the geometry
         
     Returns:
         Dict[str, Any]: Route information including distance, duration, and turn-by-turn instructions.
         Considers traffic conditions and road restrictions.
     """
     try:
-        # Convert origin address to coordinates
-        origin_result = maps_geo(origin_address, origin_city)
-        if "error" in origin_result:
-            return {"error": f"Failed to geocode origin address: {origin_result['error']}"}
-        
-        if not origin_result.get("return") or not origin_result["return"]:
-            return {"error": "No geocoding results found for origin address"}
-        
-        origin_location = origin_result["return"][0].get("location")
-        if not origin_location:
-            return {"error": "Could not extract coordinates from origin geocoding result"}
-        
-        # Convert destination address to coordinates
-        destination_result = maps_geo(destination_address, destination_city)
-        if "error" in destination_result:
-            return {"error": f"Failed to geocode destination address: {destination_result['error']}"}
-        
-        if not destination_result.get("return") or not destination_result["return"]:
-            return {"error": "No geocoding results found for destination address"}
-        
-        destination_location = destination_result["return"][0].get("location")
-        if not destination_location:
-            return {"error": "Could not extract coordinates from destination geocoding result"}
-        
-        # Use the coordinates to plan the driving route
-        route_result = maps_direction_driving_by_coordinates(origin_location, destination_location)
-        
-        # Add address information to the result
-        if "error" not in route_result:
-            route_result["addresses"] = {
-                "origin": {
-                    "address": origin_address,
-                    "coordinates": origin_location
-                },
-                "destination": {
-                    "address": destination_address,
-                    "coordinates": destination_location
-                }
-            }
-        
-        return route_result
+        return await route_by_address(
+            maps_direction_driving_by_coordinates,
+            origin_address, destination_address, origin_city, destination_city,
+            detail=detail, fields=fields, geometry=geometry, tolerance=tolerance
+        )
     except Exception as e:
         return {"error": f"Route planning failed: {str(e)}"}
 
 @mcp.tool()
-def maps_direction_driving_by_coordinates(origin: str, destination: str) -> Dict[str, Any]:
+async def maps_direction_driving_by_coordinates(origin: str, destination: str, detail: str = "full", fields: Optional[List[str]] = None, geometry: bool = False, tolerance: float = AMAP_GEOMETRY_TOLERANCE_M) -> Dict[str, Any]:
     """驾车路径规划 API 可以根据用户起终点经纬度坐标规划以小客车、轿车通勤出行的方案，并且返回通勤方案的数据
     
     Args:
         origin (str): 起点经纬度坐标，格式为"经度,纬度" (例如："116.434307,39.90909")
         destination (str): 终点经纬度坐标，格式为"经度,纬度" (例如："116.434307,39.90909")
+        detail (str): 返回详细程度："summary" 仅距离与时长，"steps" 附带精简导航步骤，"full"（默认）返回全部字段
+        fields (Optional[List[str]]): 可选，仅保留的路线字段，例如 ["distance", "duration"]
+        geometry (bool): 是否返回路线几何（合并各步骤坐标串，Douglas-Peucker 简化后编码为 encoded polyline），默认 False
+        tolerance (float): 几何简化容差（米）
         
     Returns:
         Dict[str, Any]: 包含距离、时长和详细导航信息的路线数据
     """
+    if detail not in ROUTE_DETAIL_LEVELS:
+        return {"error": f"Unsupported detail level: {detail}, expected one of {', '.join(ROUTE_DETAIL_LEVELS)}"}
     try:
-        response = requests.get(
-            "https://restapi.amap.com/v3/direction/driving",
+        data = await cached_route(
+            "driving",
+            "/v3/direction/driving",
             params={
-                "key": AMAP_MAPS_API_KEY,
                 "origin": origin,
                 "destination": destination
-            }
+            },
+            decode_type=RouteResponse
         )
-        response.raise_for_status()
-        data = response.json()
         
-        if data["status"] != "1":
-            return {"error": f"Direction Driving failed: {data.get('info') or data.get('infocode')}"}
+        if data.status != "1":
+            return {"error": f"Direction Driving failed: {data.info or data.infocode}"}
             
-        paths = []
-        for path in data["route"]["paths"]:
-            steps = []
-            for step in path["steps"]:
-                steps.append({
-                    "instruction": step.get("instruction"),
-                    "road": step.get("road"),
-                    "distance": step.get("distance"),
-                    "orientation": step.get("orientation"),
-                    "duration": step.get("duration")
-                })
-            paths.append({
-                "path": path.get("path"),
-                "distance": path.get("distance"),
-                "duration": path.get("duration"),
-                "steps": steps
-            })
+        keys = ("path", "distance", "duration", "tolls") if detail == "full" else ("distance", "duration", "tolls")
+        paths = [project_path(path, detail, fields, keys) for path in data.route.paths]
+        if geometry:
+            for projected, path in zip(paths, data.route.paths):
+                projected["geometry"] = path_geometry(path, tolerance)
             
         return {
             "route": {
-                "origin": data["route"]["origin"],
-                "destination": data["route"]["destination"],
+                "origin": data.route.origin,
+                "destination": data.route.destination,
                 "paths": paths
             }
         }
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         return {"error": f"Request failed: {str(e)}"}
 
 @mcp.tool()
-def maps_direction_transit_integrated_by_address(origin_address: str, destination_address: str, origin_city: str, destination_city: str) -> Dict[str, Any]:
+async def maps_direction_transit_integrated_by_address(origin_address: str, destination_address: str, origin_city: str, destination_city: str, detail: str = "full", fields: Optional[List[str]] = None, geometry: bool = False, tolerance: float = AMAP_GEOMETRY_TOLERANCE_M) -> Dict[str, Any]:
     """Plans a public transit route between two locations using addresses. Unless you have a specific reason to use coordinates, it's recommended to use this tool.
     
     Args:
@@ -484,58 +2371,31 @@ def maps_direction_transit_integrated_by_address(origin_address: str, destinatio
         destination_address (str): Ending point address (e.g. "北京市海淀区上地十街10号")
         origin_city (str): City name for the origin address (required for cross-city transit)
         destination_city (str): City name for the destination address (required for cross-city transit)
+        detail (str): "summary" (duration, cost and line names), "steps" (adds brief segments) or "full" (default, every field)
+        fields (Optional[List[str]]): Optional plan-level fields to keep, e.g. ["duration", "cost", "lines"]
+        geometry (bool): Also return each plan's geometry (walking legs and transit lines), simplified and encoded as a polyline string (default False)
+        tolerance (float): Simplification tolerance in metres for the geometry
         
     Returns:
         Dict[str, Any]: Route information including distance, duration, and detailed transit instructions.
         Considers various public transit options including buses, subways, and trains.
     """
+    # 城市不合法时在地理编码之前就返回错误
+    for label, value in (("origin_city", origin_city), ("destination_city", destination_city)):
+        _, error = adcode_index.resolve_city(value)
+        if error:
+            return {"error": f"Invalid {label}: {error}"}
     try:
-        # Convert origin address to coordinates
-        origin_result = maps_geo(origin_address, origin_city)
-        if "error" in origin_result:
-            return {"error": f"Failed to geocode origin address: {origin_result['error']}"}
-        
-        if not origin_result.get("return") or not origin_result["return"]:
-            return {"error": "No geocoding results found for origin address"}
-        
-        origin_location = origin_result["return"][0].get("location")
-        if not origin_location:
-            return {"error": "Could not extract coordinates from origin geocoding result"}
-        
-        # Convert destination address to coordinates
-        destination_result = maps_geo(destination_address, destination_city)
-        if "error" in destination_result:
-            return {"error": f"Failed to geocode destination address: {destination_result['error']}"}
-        
-        if not destination_result.get("return") or not destination_result["return"]:
-            return {"error": "No geocoding results found for destination address"}
-        
-        destination_location = destination_result["return"][0].get("location")
-        if not destination_location:
-            return {"error": "Could not extract coordinates from destination geocoding result"}
-        
-        # Use the coordinates to plan the transit route
-        route_result = maps_direction_transit_integrated_by_coordinates(origin_location, destination_location, origin_city, destination_city)
-        
-        # Add address information to the result
-        if "error" not in route_result:
-            route_result["addresses"] = {
-                "origin": {
-                    "address": origin_address,
-                    "coordinates": origin_location
-                },
-                "destination": {
-                    "address": destination_address,
-                    "coordinates": destination_location
-                }
-            }
-        
-        return route_result
+        return await route_by_address(
+            maps_direction_transit_integrated_by_coordinates,
+            origin_address, destination_address, origin_city, destination_city,
+            city=origin_city, cityd=destination_city, detail=detail, fields=fields, geometry=geometry, tolerance=tolerance
+        )
     except Exception as e:
         return {"error": f"Route planning failed: {str(e)}"}
 
 @mcp.tool()
-def maps_direction_transit_integrated_by_coordinates(origin: str, destination: str, city: str, cityd: str) -> Dict[str, Any]:
+async def maps_direction_transit_integrated_by_coordinates(origin: str, destination: str, city: str, cityd: str, detail: str = "full", fields: Optional[List[str]] = None, geometry: bool = False, tolerance: float = AMAP_GEOMETRY_TOLERANCE_M) -> Dict[str, Any]:
     """根据用户起终点经纬度坐标规划综合各类公共（火车、公交、地铁）交通方式的通勤方案，并且返回通勤方案的数据，跨城场景下必须传起点城市与终点城市
     
     Args:
@@ -543,110 +2403,152 @@ def maps_direction_transit_integrated_by_coordinates(origin: str, destination: s
         destination (str): 终点经纬度坐标，格式为"经度,纬度" (例如："116.434307,39.90909")
         city (str): 起点城市名称
         cityd (str): 终点城市名称
+        detail (str): 返回详细程度："summary" 仅时长、费用与线路名称，"steps" 附带精简换乘分段，"full"（默认）返回全部字段
+        fields (Optional[List[str]]): 可选，仅保留的方案字段，例如 ["duration", "cost", "lines"]
+        geometry (bool): 是否返回方案几何（步行段与公交/地铁线路），简化后编码为 encoded polyline，默认 False
+        tolerance (float): 几何简化容差（米）
         
     Returns:
         Dict[str, Any]: 包含距离、时长和详细公共交通信息的路线数据
     """
+    if detail not in ROUTE_DETAIL_LEVELS:
+        return {"error": f"Unsupported detail level: {detail}, expected one of {', '.join(ROUTE_DETAIL_LEVELS)}"}
+    if not normalize_text(city) or not normalize_text(cityd):
+        return {"error": "Both city and cityd are required for transit planning"}
+    # 起终点城市先经离线行政区划索引统一为 citycode，省份名称直接报错，索引中没有的名称原样交给高德解析
+    origin_city, error = adcode_index.resolve_city(city)
+    if error:
+        return {"error": f"Invalid city: {error}"}
+    destination_city, error = adcode_index.resolve_city(cityd)
+    if error:
+        return {"error": f"Invalid cityd: {error}"}
     try:
-        response = requests.get(
-            "https://restapi.amap.com/v3/direction/transit/integrated",
+        data = await cached_route(
+            "transit",
+            "/v3/direction/transit/integrated",
             params={
-                "key": AMAP_MAPS_API_KEY,
                 "origin": origin,
                 "destination": destination,
-                "city": city,
-                "cityd": cityd
-            }
+                "city": origin_city,
+                "cityd": destination_city
+            },
+            decode_type=TransitResponse
         )
-        response.raise_for_status()
-        data = response.json()
         
-        if data["status"] != "1":
-            return {"error": f"Direction Transit Integrated failed: {data.get('info') or data.get('infocode')}"}
+        if data.status != "1":
+            return {"error": f"Direction Transit Integrated failed: {data.info or data.infocode}"}
             
-        transits = []
-        if data["route"].get("transits"):
-            for transit in data["route"]["transits"]:
-                segments = []
-                if transit.get("segments"):
-                    for segment in transit["segments"]:
-                        walking_steps = []
-                        if segment.get("walking", {}).get("steps"):
-                            for step in segment["walking"]["steps"]:
-                                walking_steps.append({
-                                    "instruction": step.get("instruction"),
-                                    "road": step.get("road"),
-                                    "distance": step.get("distance"),
-                                    "action": step.get("action"),
-                                    "assistant_action": step.get("assistant_action")
-                                })
-                                
-                        buslines = []
-                        if segment.get("bus", {}).get("buslines"):
-                            for busline in segment["bus"]["buslines"]:
-                                via_stops = []
-                                if busline.get("via_stops"):
-                                    for stop in busline["via_stops"]:
-                                        via_stops.append({"name": stop.get("name")})
-                                        
-                                buslines.append({
-                                    "name": busline.get("name"),
-                                    "departure_stop": {"name": busline.get("departure_stop", {}).get("name")},
-                                    "arrival_stop": {"name": busline.get("arrival_stop", {}).get("name")},
-                                    "distance": busline.get("distance"),
-                                    "duration": busline.get("duration"),
-                                    "via_stops": via_stops
-                                })
-                                
-                        segments.append({
-                            "walking": {
-                                "origin": segment.get("walking", {}).get("origin"),
-                                "destination": segment.get("walking", {}).get("destination"),
-                                "distance": segment.get("walking", {}).get("distance"),
-                                "duration": segment.get("walking", {}).get("duration"),
-                                "steps": walking_steps
-                            },
-                            "bus": {"buslines": buslines},
-                            "entrance": {"name": segment.get("entrance", {}).get("name")},
-                            "exit": {"name": segment.get("exit", {}).get("name")},
-                            "railway": {
-                                "name": segment.get("railway", {}).get("name"),
-                                "trip": segment.get("railway", {}).get("trip")
-                            }
-                        })
-                        
-                transits.append({
-                    "duration": transit.get("duration"),
-                    "walking_distance": transit.get("walking_distance"),
-                    "segments": segments
-                })
-                
+        transits = [project_transit(transit, detail, fields) for transit in data.route.transits]
+        if geometry:
+            for projected, transit in zip(transits, data.route.transits):
+                projected["geometry"] = transit_geometry(transit, tolerance)
+        
         return {
             "route": {
-                "origin": data["route"]["origin"],
-                "destination": data["route"]["destination"],
-                "distance": data["route"].get("distance"),
+                "origin": data.route.origin,
+                "destination": data.route.destination,
+                "distance": data.route.distance,
                 "transits": transits
             }
         }
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         return {"error": f"Request failed: {str(e)}"}
 
 @mcp.tool()
-def maps_distance(origins: str, destination: str, type: str = "1") -> Dict[str, Any]:
+async def maps_compare_routes(origin_address: str, destination_address: str, origin_city: Optional[str] = None, destination_city: Optional[str] = None, modes: Optional[List[str]] = None, timeout: float = AMAP_COMPARE_MODE_TIMEOUT) -> Dict[str, Any]:
+    """对比两个地点之间多种出行方式（驾车、步行、骑行、公共交通）的路线，起终点只解析一次，各方式并发查询，按时长排序返回精简结果
+    
+    Args:
+        origin_address (str): 起点地址 (例如："北京市朝阳区阜通东大街6号")
+        destination_address (str): 终点地址 (例如："北京市海淀区上地十街10号")
+        origin_city (Optional[str]): 可选的起点城市，公共交通规划缺省时使用地理编码得到的城市
+        destination_city (Optional[str]): 可选的终点城市
+        modes (Optional[List[str]]): 需要对比的出行方式，可选 driving / walking / bicycling / transit，默认全部
+        timeout (float): 单个出行方式的超时时间（秒），超时的方式单独报错，不影响其他方式
+        
+    Returns:
+        Dict[str, Any]: routes 为按时长升序排列的各方式距离（米）、时长（秒）、费用（元）与步行距离（米），失败的方式排在最后
+    """
+    modes = list(dict.fromkeys(modes or ROUTE_MODES))
+    unknown = [mode for mode in modes if mode not in ROUTE_MODES]
+    if unknown:
+        return {"error": f"Unsupported modes: {', '.join(unknown)}, expected any of {', '.join(ROUTE_MODES)}"}
+    
+    started = time.perf_counter()
+    origin, destination = await asyncio.gather(
+        resolve_address(origin_address, origin_city, "origin"),
+        resolve_address(destination_address, destination_city, "destination")
+    )
+    geocoded = time.perf_counter()
+    for endpoint in (origin, destination):
+        if "error" in endpoint:
+            return endpoint
+
+    async def plan(mode: str) -> Dict[str, Any]:
+        if mode == "driving":
+            result = await maps_direction_driving_by_coordinates(origin["location"], destination["location"], detail="summary")
+        elif mode == "walking":
+            result = await maps_direction_walking_by_coordinates(origin["location"], destination["location"], detail="summary")
+        elif mode == "bicycling":
+            result = await maps_bicycling_by_coordinates(origin["location"], destination["location"], detail="summary")
+        else:
+            result = await maps_direction_transit_integrated_by_coordinates(
+                origin["location"], destination["location"],
+                origin_city or origin.get("citycode") or "", destination_city or destination.get("citycode") or "",
+                detail="summary"
+            )
+        return summarize_route(mode, result)
+
+    async def plan_with_timeout(mode: str) -> Dict[str, Any]:
+        try:
+            return await asyncio.wait_for(plan(mode), timeout)
+        except asyncio.TimeoutError:
+            return {"mode": mode, "error": f"Timed out after {timeout}s"}
+        except Exception as e:
+            return {"mode": mode, "error": f"Route planning failed: {str(e)}"}
+
+    routes = await asyncio.gather(*(plan_with_timeout(mode) for mode in modes))
+    finished = time.perf_counter()
+    routes = sorted(routes, key=lambda route: (route.get("duration") is None, route.get("duration") or 0))
+    return {
+        "addresses": {
+            "origin": {"address": origin_address, "coordinates": origin["location"]},
+            "destination": {"address": destination_address, "coordinates": destination["location"]}
+        },
+        "fastest": routes[0]["mode"] if routes and routes[0].get("duration") is not None else None,
+        "routes": routes,
+        "timing": {
+            "geocode_ms": round((geocoded - started) * 1000, 1),
+            "routes_ms": round((finished - geocoded) * 1000, 1),
+            "total_ms": round((finished - started) * 1000, 1)
+        }
+    }
+
+@mcp.tool()
+async def maps_distance(origins: str, destination: str, type: str = "1") -> Dict[str, Any]:
     """测量两个经纬度坐标之间的距离,支持驾车、步行以及球面距离测量"""
+    if type == "0":
+        # 球面距离在本地计算，无需请求高德
+        try:
+            distances = spherical_distance_matrix(
+                locations_to_array(split_locations(origins)),
+                locations_to_array([destination])
+            )[:, 0]
+        except ValueError as e:
+            return {"error": f"Invalid location: {str(e)}"}
+        return {"results": [
+            {"origin_id": str(i + 1), "dest_id": "1", "distance": str(int(round(distance))), "duration": "0"}
+            for i, distance in enumerate(distances)
+        ]}
     try:
-        response = requests.get(
-            "https://restapi.amap.com/v3/distance",
+        data = await amap_get(
+            "/v3/distance",
             params={
-                "key": AMAP_MAPS_API_KEY,
                 "origins": origins,
                 "destination": destination,
                 "type": type
             }
         )
-        response.raise_for_status()
-        data = response.json()
         
         if data["status"] != "1":
             return {"error": f"Direction Distance failed: {data.get('info') or data.get('infocode')}"}
@@ -661,24 +2563,281 @@ def maps_distance(origins: str, destination: str, type: str = "1") -> Dict[str,
             })
             
         return {"results": results}
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         return {"error": f"Request failed: {str(e)}"}
 
 @mcp.tool()
-def maps_text_search(keywords: str, city: str = "", citylimit: str = "false") -> Dict[str, Any]:
-    """关键词搜索 API 根据用户输入的关键字进行 POI 搜索，并返回相关的信息"""
+async def maps_distance_matrix_local(origins: List[str], destinations: List[str]) -> Dict[str, Any]:
+    """本地计算多个起点与多个终点之间的球面直线距离矩阵（单位：米），不请求高德接口，适合大规模覆盖分析
+    
+    Args:
+        origins (List[str]): 起点坐标列表，格式为"经度,纬度"
+        destinations (List[str]): 终点坐标列表，格式为"经度,纬度"
+        
+    Returns:
+        Dict[str, Any]: distances[i][j] 为第 i 个起点到第 j 个终点的距离；单元数超过 AMAP_DISTANCE_MATRIX_LOCAL_MAX_CELLS 时返回错误
+    """
+    origin_list = split_locations(origins)
+    destination_list = split_locations(destinations)
+    too_large = local_matrix_too_large(origin_list, destination_list)
+    if too_large:
+        return too_large
     try:
-        response = requests.get(
-            "https://restapi.amap.com/v3/place/text",
-            params={
-                "key": AMAP_MAPS_API_KEY,
-                "keywords": keywords,
-                "city": city,
-                "citylimit": citylimit
-            }
+        distances = spherical_distance_matrix(
+            locations_to_array(origin_list),
+            locations_to_array(destination_list)
         )
-        response.raise_for_status()
-        data = response.json()
+    except ValueError as e:
+        return {"error": f"Invalid location: {str(e)}"}
+    return {
+        "origins": distances.shape[0],
+        "destinations": distances.shape[1],
+        "unit": "m",
+        "distances": np.rint(distances).astype(np.int64).tolist()
+    }
+
+@mcp.tool()
+async def maps_distance_matrix(origins: List[str], destinations: List[str], type: str = "1") -> Dict[str, Any]:
+    """批量测量多个起点到多个终点的距离与时长矩阵，自动拆分为高德允许的请求并发执行
+    
+    Args:
+        origins (List[str]): 起点坐标列表，格式为"经度,纬度"
+        destinations (List[str]): 终点坐标列表，格式为"经度,纬度"
+        type (str): 0：直线距离（本地计算）；1：驾车导航距离；3：步行规划距离（仅支持5km之内）
+        
+    Returns:
+        Dict[str, Any]: distance[i][j]（米）与 duration[i][j]（秒）为第 i 个起点到第 j 个终点的结果，失败的单元为 null
+    """
+    if type not in ("0", "1", "3"):
+        return {"error": f"Unsupported distance type: {type}"}
+    try:
+        origin_list = split_locations(origins)
+        destination_list = split_locations(destinations)
+        locations_to_array(origin_list + destination_list)
+    except ValueError as e:
+        return {"error": f"Invalid location: {str(e)}"}
+    if type == "0":
+        too_large = local_matrix_too_large(origin_list, destination_list)
+        if too_large:
+            return too_large
+    
+    matrix = await distance_matrix(origin_list, destination_list, type)
+    return {
+        "origins": len(origin_list),
+        "destinations": len(destination_list),
+        "type": type,
+        **matrix
+    }
+
+@mcp.tool()
+async def maps_isochrone(center: str, minutes: float, mode: str = "driving", rays: int = 16, refine: int = 3, max_radius_m: Optional[float] = None, sites: Optional[List[str]] = None) -> Dict[str, Any]:
+    """等时圈：估算在给定时间内可以到达中心点的范围，返回可达多边形与统计信息，并可判断候选地点是否可达
+    
+    沿 rays 个方向按同心环采样候选点，候选点作为起点、中心点作为终点批量并发调用距离测量接口，
+    之后只在每个方向的可达/不可达边界之间二分细化 refine 次，请求数远少于规则网格。
+    
+    Args:
+        center (str): 中心点经纬度坐标，格式为"经度,纬度" (例如："116.434307,39.90909")
+        minutes (float): 时间预算（分钟）
+        mode (str): 出行方式，driving（驾车）或 walking（步行，仅支持5km之内）
+        rays (int): 采样方向数量，最多100
+        refine (int): 边界二分细化次数
+        max_radius_m (Optional[float]): 可选的最大搜索半径（米），默认按速度上限与时间预算估算
+        sites (Optional[List[str]]): 可选的候选地点坐标列表，逐个精确查询到中心点的时长并判断是否可达
+        
+    Returns:
+        Dict[str, Any]: polygon 为可达范围多边形的顶点（首尾闭合），boundary 为各方向已确认可达与不可达的距离（米），
+        stats 为请求数、采样点数、面积与耗时，sites 为候选地点的时长与可达判断
+    """
+    if mode not in ISOCHRONE_DISTANCE_TYPES:
+        return {"error": f"Unsupported mode: {mode}, expected one of {', '.join(ISOCHRONE_DISTANCE_TYPES)}"}
+    if minutes <= 0:
+        return {"error": "minutes must be positive"}
+    if not 3 <= rays <= AMAP_DISTANCE_MAX_ORIGINS:
+        return {"error": f"rays must be between 3 and {AMAP_DISTANCE_MAX_ORIGINS}"}
+    try:
+        center_lng, center_lat = parse_location(center)
+        site_list = split_locations(sites or [])
+        locations_to_array(site_list)
+    except ValueError as e:
+        return {"error": f"Invalid location: {str(e)}"}
+    
+    started = time.perf_counter()
+    distance_type = ISOCHRONE_DISTANCE_TYPES[mode]
+    budget = minutes * 60
+    max_radius = max_radius_m or AMAP_ISOCHRONE_SPEED_KMH[mode] / 3.6 * budget
+    if mode == "walking":
+        max_radius = min(max_radius, AMAP_WALKING_DISTANCE_MAX_M)
+    bearings = [360.0 * i / rays for i in range(rays)]
+    site_task = asyncio.ensure_future(distance_matrix(site_list, [center], distance_type)) if site_list else None
+    requests = 0
+    sampled = 0
+    errors: List[Dict[str, Any]] = []
+
+    async def travel_times(candidates: List[Tuple[float, float]]) -> List[Optional[int]]:
+        nonlocal requests, sampled
+        matrix = await distance_matrix([format_location(lng, lat) for lng, lat in candidates], [center], distance_type)
+        requests += matrix["requests"]
+        sampled += len(candidates)
+        errors.extend(matrix["errors"])
+        return [row[0] for row in matrix["duration"]]
+
+    try:
+        # 初始采样：每个方向取 AMAP_ISOCHRONE_RINGS 个等距环，找到第一个超出预算（或无结果）的环
+        radii = [max_radius * (k + 1) / AMAP_ISOCHRONE_RINGS for k in range(AMAP_ISOCHRONE_RINGS)]
+        durations = await travel_times([
+            offset_location(center_lng, center_lat, bearing, radius) for bearing in bearings for radius in radii
+        ])
+        lo = [0.0] * rays
+        hi = [max_radius] * rays
+        for ray in range(rays):
+            lo[ray] = max_radius
+            for k, radius in enumerate(radii):
+                duration = durations[ray * len(radii) + k]
+                if duration is None or duration > budget:
+                    lo[ray] = radii[k - 1] if k else 0.0
+                    hi[ray] = radius
+                    break
+
+        # 只在仍有不确定区间的方向上二分细化，每轮所有方向合并为一批请求
+        for _ in range(refine):
+            open_rays = [ray for ray in range(rays) if hi[ray] > lo[ray]]
+            if not open_rays:
+                break
+            mids = [(lo[ray] + hi[ray]) / 2 for ray in open_rays]
+            durations = await travel_times([
+                offset_location(center_lng, center_lat, bearings[ray], mid) for ray, mid in zip(open_rays, mids)
+            ])
+            for ray, mid, duration in zip(open_rays, mids, durations):
+                if duration is None or duration > budget:
+                    hi[ray] = mid
+                else:
+                    lo[ray] = mid
+        site_matrix = await site_task if site_task else None
+    except BaseException:
+        if site_task:
+            site_task.cancel()
+        raise
+
+    vertices = [offset_location(center_lng, center_lat, bearing, radius) for bearing, radius in zip(bearings, lo)]
+    polygon = np.array(vertices, dtype=np.float64)
+    result = {
+        "center": center,
+        "mode": mode,
+        "minutes": minutes,
+        "polygon": [format_location(lng, lat) for lng, lat in vertices + vertices[:1]],
+        "boundary": [
+            {"bearing": bearing, "reachable_m": round(reachable), "unreachable_m": round(unreachable) if unreachable > reachable else None}
+            for bearing, reachable, unreachable in zip(bearings, lo, hi)
+        ],
+        "stats": {
+            "max_radius_m": round(max_radius),
+            "sampled_points": sampled,
+            "requests": requests,
+            "area_km2": round(polygon_area_m2(polygon) / 1e6, 3),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+        },
+        "errors": errors
+    }
+    if site_matrix is not None:
+        inside = polygon_contains(polygon, locations_to_array(site_list)).tolist()
+        result["sites"] = [
+            {
+                "location": location,
+                "distance": site_matrix["distance"][i][0],
+                "duration": site_matrix["duration"][i][0],
+                "reachable": site_matrix["duration"][i][0] is not None and site_matrix["duration"][i][0] <= budget,
+                "inside_polygon": inside[i]
+            }
+            for i, location in enumerate(site_list)
+        ]
+        result["stats"]["requests"] += site_matrix["requests"]
+        result["errors"].extend(site_matrix["errors"])
+    return result
+
+@mcp.tool()
+async def maps_route_weather(origin: str, destination: str, mode: str = "driving", interval_m: float = AMAP_ROUTE_WEATHER_INTERVAL_M) -> Dict[str, Any]:
+    """沿途天气：规划路线后按固定间隔采样路线坐标，批量逆地理编码并按城市 adcode 去重，再并发查询各城市天气预报，
+    每个城市只查询一次，按沿途先后顺序返回
+    
+    Args:
+        origin (str): 起点经纬度坐标，格式为"经度,纬度" (例如："116.434307,39.90909")
+        destination (str): 终点经纬度坐标，格式为"经度,纬度" (例如："121.473701,31.230416")
+        mode (str): 出行方式，driving / walking / bicycling，默认 driving
+        interval_m (float): 采样间隔（米），采样点过多时自动放大
+        
+    Returns:
+        Dict[str, Any]: cities 为沿途城市列表，每项包含 adcode、城市名称、首次经过时距起点的路线距离（米）与天气预报
+    """
+    if mode not in ROUTE_ENDPOINTS:
+        return {"error": f"Unsupported mode: {mode}, expected one of {', '.join(ROUTE_ENDPOINTS)}"}
+    if interval_m <= 0:
+        return {"error": "interval_m must be positive"}
+    try:
+        path, decode_type = ROUTE_ENDPOINTS[mode]
+        data = await cached_route(mode, path, params={"origin": origin, "destination": destination}, decode_type=decode_type)
+    except httpx.HTTPError as e:
+        return {"error": f"Request failed: {str(e)}"}
+    if (data.errcode != 0) if mode == "bicycling" else (data.status != "1"):
+        return {"error": f"Direction {mode} failed: {(data.errmsg or data.errcode) if mode == 'bicycling' else (data.info or data.infocode)}"}
+    plan = data.data if mode == "bicycling" else data.route
+    paths = plan.paths if isinstance(plan, RoutePlan) else []
+    if not paths:
+        return {"error": "No route found"}
+    
+    points = merge_polylines(step.polyline for step in paths[0].steps)
+    if not len(points):
+        return {"error": "Route has no geometry"}
+    route_length = float(as_number(paths[0].distance) or 0)
+    interval_m = max(interval_m, route_length / AMAP_ROUTE_WEATHER_MAX_SAMPLES)
+    samples, offsets = sample_polyline(points, interval_m)
+    components = await regeocode_many([format_location(lng, lat) for lng, lat in samples.tolist()])
+    
+    # 按沿途顺序去重到城市级 adcode，记录首次经过的位置
+    first_seen: Dict[str, float] = {}
+    failed_samples = 0
+    for component, offset in zip(components, offsets.tolist()):
+        adcode = city_adcode(component.get("adcode"))
+        if adcode is None:
+            failed_samples += 1
+            continue
+        first_seen.setdefault(adcode, offset)
+    
+    adcodes = list(first_seen)
+    forecasts = await gather_limited(AMAP_BATCH_CONCURRENCY, (maps_weather(adcode) for adcode in adcodes))
+    cities = []
+    for adcode, forecast in zip(adcodes, forecasts):
+        entry = {"adcode": adcode, "distance_m": round(first_seen[adcode])}
+        entry.update({"error": forecast["error"]} if "error" in forecast else forecast)
+        cities.append(entry)
+    return {
+        "route": {"mode": mode, "distance": paths[0].distance, "duration": paths[0].duration},
+        "interval_m": round(interval_m),
+        "samples": len(samples),
+        "unresolved_samples": failed_samples,
+        "cities": cities
+    }
+
+@mcp.tool()
+async def maps_text_search(keywords: str, city: str = "", citylimit: str = "false", max_results: Optional[int] = None, full_detail: bool = False, ctx: Context = None) -> Dict[str, Any]:
+    """关键词搜索 API 根据用户输入的关键字进行 POI 搜索，并返回相关的信息。
+    默认只返回第一页；指定 max_results 时自动并发翻页，最多返回 max_results 个POI，并以进度通知逐页推送结果。
+    full_detail 为 true 时以 extensions=all 搜索，并用返回的完整信息预热 POI 详情缓存，之后的 maps_search_detail 无需再请求"""
+    try:
+        params = {
+            "keywords": keywords,
+            "city": city,
+            "citylimit": citylimit
+        }
+        if full_detail:
+            params["extensions"] = "all"
+        if max_results:
+            data = await fetch_place_pages("/v3/place/text", params, max_results, ctx)
+        else:
+            data = await amap_get(
+                "/v3/place/text",
+                params=params
+            )
         
         if data["status"] != "1":
             return {"error": f"Text Search failed: {data.get('info') or data.get('infocode')}"}
@@ -688,70 +2847,124 @@ def maps_text_search(keywords: str, city: str = "", citylimit: str = "false") ->
             for city in data["suggestion"]["cities"]:
                 suggestion_cities.append({"name": city.get("name")})
                 
-        pois = []
-        for poi in data.get("pois", []):
-            pois.append({
-                "id": poi.get("id"),
-                "name": poi.get("name"),
-                "address": poi.get("address"),
-                "typecode": poi.get("typecode")
-            })
+        remember_pois(data.get("pois", []))
+        pois = [poi_entry(poi) for poi in data.get("pois", [])]
             
-        return {
+        result = {
             "suggestion": {
                 "keywords": data.get("suggestion", {}).get("keywords"),
                 "cities": suggestion_cities
             },
             "pois": pois
         }
-    except requests.exceptions.RequestException as e:
+        if data.get("page_errors"):
+            result["page_errors"] = data["page_errors"]
+        return result
+    except httpx.HTTPError as e:
         return {"error": f"Request failed: {str(e)}"}
 
 @mcp.tool()
-def maps_around_search(location: str, radius: str = "1000", keywords: str = "") -> Dict[str, Any]:
-    """周边搜，根据用户传入关键词以及坐标location，搜索出radius半径范围的POI"""
+async def maps_around_search(location: str, radius: str = "1000", keywords: Union[str, List[str]] = "", max_results: Optional[int] = None, full_detail: bool = False, ctx: Context = None) -> Dict[str, Any]:
+    """周边搜，根据用户传入关键词以及坐标location，搜索出radius半径范围的POI。
+    默认只返回第一页；指定 max_results 时自动并发翻页，最多返回 max_results 个POI，并以进度通知逐页推送结果。
+    若该范围已被近期一次完整的周边搜覆盖，则直接由本地空间索引返回。
+    keywords 也可以是关键词列表（例如 ["咖啡", "便利店", "地铁站"]）：各关键词并发搜索（max_results 按关键词计），
+    结果按 POI id 去重合并，matched_keywords 记录命中的关键词，并按到中心点的距离升序排列。
+    full_detail 为 true 时以 extensions=all 搜索，并用返回的完整信息预热 POI 详情缓存"""
+    if isinstance(keywords, list):
+        keyword_list = list(dict.fromkeys(keyword.strip() for keyword in keywords if keyword and keyword.strip()))
+        if len(keyword_list) > 1:
+            return await around_search_keywords(location, radius, keyword_list, max_results, full_detail)
+        keywords = keyword_list[0] if keyword_list else ""
+    keyword_key = normalize_text(keywords)
     try:
-        response = requests.get(
-            "https://restapi.amap.com/v3/place/around",
-            params={
-                "key": AMAP_MAPS_API_KEY,
-                "location": location,
-                "radius": radius,
-                "keywords": keywords
-            }
-        )
-        response.raise_for_status()
-        data = response.json()
+        center = parse_location(location)
+        radius_m = float(radius)
+    except ValueError:
+        center = None
+    # 半径超出高德的取值范围时实际搜索范围与之不符，既不由本地索引应答也不记录为已覆盖
+    radius_valid = center is not None and 0 < radius_m <= AMAP_AROUND_MAX_RADIUS_M
+    if radius_valid and not full_detail and poi_index.covered(center[0], center[1], radius_m, keyword_key):
+        poi_index.local_answers += 1
+        return {"pois": poi_index.query(center[0], center[1], radius_m, keyword_key)[:max_results or AMAP_PLACE_DEFAULT_PAGE_SIZE]}
+    try:
+        params = {
+            "location": location,
+            "radius": radius,
+            "keywords": keywords
+        }
+        if full_detail:
+            params["extensions"] = "all"
+        if max_results:
+            data = await fetch_place_pages("/v3/place/around", params, max_results, ctx)
+        else:
+            data = await amap_get(
+                "/v3/place/around",
+                params=params
+            )
         
         if data["status"] != "1":
             return {"error": f"Around Search failed: {data.get('info') or data.get('infocode')}"}
             
-        pois = []
-        for poi in data.get("pois", []):
-            pois.append({
-                "id": poi.get("id"),
-                "name": poi.get("name"),
-                "address": poi.get("address"),
-                "typecode": poi.get("typecode")
-            })
+        remember_pois(data.get("pois", []))
+        pois = [poi_entry(poi) for poi in data.get("pois", [])]
+        if center:
+            poi_index.api_fallbacks += 1
+            poi_index.add(data.get("pois", []), keyword_key)
+            if radius_valid and not data.get("page_errors") and int(data.get("count") or 0) <= len(pois):
+                poi_index.record_search(center[0], center[1], radius_m, keyword_key)
             
-        return {"pois": pois}
-    except requests.exceptions.RequestException as e:
+        result = {"pois": pois}
+        if data.get("page_errors"):
+            result["page_errors"] = data["page_errors"]
+        return result
+    except httpx.HTTPError as e:
         return {"error": f"Request failed: {str(e)}"}
 
+async def around_search_keywords(location: str, radius: str, keywords: List[str], max_results: Optional[int], full_detail: bool = False) -> Dict[str, Any]:
+    """Run one around search per keyword concurrently and merge the POIs by id, nearest first"""
+    results = await asyncio.gather(*(maps_around_search(location, radius, keyword, max_results, full_detail) for keyword in keywords))
+    try:
+        center = parse_location(location)
+    except ValueError:
+        center = None
+    merged: Dict[str, Dict[str, Any]] = {}
+    errors = []
+    for keyword, result in zip(keywords, results):
+        if "error" in result:
+            errors.append({"keywords": keyword, "error": result["error"]})
+            continue
+        if result.get("page_errors"):
+            errors.append({"keywords": keyword, "page_errors": result["page_errors"]})
+        for poi in result["pois"]:
+            entry = merged.get(poi["id"])
+            if entry is None:
+                entry = merged[poi["id"]] = {**poi, "matched_keywords": []}
+                poi_location = poi_index.location(poi["id"])
+                if center and poi_location:
+                    entry["distance"] = round(haversine_m(center[0], center[1], poi_location[0], poi_location[1]))
+            entry["matched_keywords"].append(keyword)
+    if len(errors) == len(keywords) and all("error" in error for error in errors):
+        return {"error": "; ".join(f"{error['keywords']}: {error['error']}" for error in errors)}
+    pois = sorted(merged.values(), key=lambda poi: (poi.get("distance") is None, poi.get("distance") or 0))
+    result = {"pois": pois}
+    if errors:
+        result["errors"] = errors
+    return result
+
 @mcp.tool()
-def maps_search_detail(id: str) -> Dict[str, Any]:
+async def maps_search_detail(id: str) -> Dict[str, Any]:
     """查询关键词搜或者周边搜获取到的POI ID的详细信息"""
+    cached = poi_detail_cache.get(id)
+    if cached is not None:
+        return copy.deepcopy(cached)
     try:
-        response = requests.get(
-            "https://restapi.amap.com/v3/place/detail",
+        data = await amap_get(
+            "/v3/place/detail",
             params={
-                "key": AMAP_MAPS_API_KEY,
                 "id": id
             }
         )
-        response.raise_for_status()
-        data = response.json()
         
         if data["status"] != "1":
             return {"error": f"Get poi detail failed: {data.get('info') or data.get('infocode')}"}
@@ -759,26 +2972,74 @@ def maps_search_detail(id: str) -> Dict[str, Any]:
         if not data.get("pois"):
             return {"error": "No POI found"}
             
-        poi = data["pois"][0]
-        result = {
-            "id": poi.get("id"),
-            "name": poi.get("name"),
-            "location": poi.get("location"),
-            "address": poi.get("address"),
-            "business_area": poi.get("business_area"),
-            "city": poi.get("cityname"),
-            "type": poi.get("type"),
-            "alias": poi.get("alias")
-        }
-        
-        # Add biz_ext data if available
-        if poi.get("biz_ext"):
-            result.update(poi["biz_ext"])
-            
+        result = poi_detail(data["pois"][0])
+        poi_detail_cache.set(id, copy.deepcopy(result))
         return result
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         return {"error": f"Request failed: {str(e)}"}
 
+@mcp.tool()
+async def maps_search_detail_batch(ids: List[str]) -> Dict[str, Any]:
+    """批量查询多个POI ID的详细信息，已缓存的POI直接返回，其余并发查询，结果与输入顺序一致
+    
+    Args:
+        ids (List[str]): 关键词搜或者周边搜获取到的POI ID列表
+        
+    Returns:
+        Dict[str, Any]: {"results": [...]}，每项为POI详情或 {"id", "error"}
+    """
+    # 高德 v3 详情接口每次仅支持一个ID，因此对未命中缓存的ID并发请求（相同ID只请求一次）
+    unique_ids = list(dict.fromkeys(ids))
+    details = await gather_limited(AMAP_BATCH_CONCURRENCY, (maps_search_detail(poi_id) for poi_id in unique_ids))
+    by_id = {
+        poi_id: {"id": poi_id, **detail} if "error" in detail else detail
+        for poi_id, detail in zip(unique_ids, details)
+    }
+    return {"results": [copy.deepcopy(by_id[poi_id]) for poi_id in ids]}
+
+@mcp.tool()
+async def maps_reload_adcode_index() -> Dict[str, Any]:
+    """从本地文件重新加载行政区划（adcode/citycode）离线索引"""
+    try:
+        entries = adcode_index.reload()
+    except (OSError, ValueError, csv.Error) as e:
+        return {"error": f"Reload adcode index failed: {str(e)}"}
+    return {"path": adcode_index.path, "entries": entries}
+
+@mcp.tool()
+async def maps_reload_district_index() -> Dict[str, Any]:
+    """从本地 GeoJSON 文件重新加载区县边界离线逆地理编码索引"""
+    if not district_index.path:
+        return {"error": "AMAP_DISTRICT_BOUNDARIES is not configured"}
+    try:
+        features = district_index.reload()
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        return {"error": f"Reload district index failed: {str(e)}"}
+    return {"path": district_index.path, "features": features}
+
+@mcp.tool()
+async def maps_server_stats() -> Dict[str, Any]:
+    """查询地图服务本地缓存的命中/未命中等运行统计"""
+    return {
+        "geocode_cache": geocode_cache.stats(),
+        "weather_cache": weather_cache.stats(),
+        "weather_aliases": weather_aliases.stats(),
+        "poi_detail_cache": poi_detail_cache.stats(),
+        "poi_index": poi_index.stats(),
+        "route_cache": route_cache.stats(),
+        "ip_cache": ip_cache.stats(),
+        "district_index": district_index.stats(),
+        "rate_limiter": rate_limiter.stats(),
+        "single_flight": single_flight.stats()
+    }
+
+async def main() -> None:
+    try:
+        await mcp.run_sse_async()
+    finally:
+        await close_http_client()
+        geocode_cache.close()
+
 if __name__ == "__main__":
     mcp.settings.port=int(os.getenv('AMAP_PORT'))
-    mcp.run(transport='sse')
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
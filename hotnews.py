@@ -9,6 +9,8 @@ from typing import Any
 import asyncio
 import datetime
 import json
+import time
+import importlib.util
 from mcp.server.fastmcp import FastMCP
 from pydantic import Field
 from typing import Annotated
@@ -53,6 +55,19 @@ BASE_URL = get_base_url()
 logger = logging.getLogger('mcp_news_server')
 logger.info(f"启动新闻MCP服务器，API基础URL: {BASE_URL}")
 
+# HTTP 客户端配置：连接/读取超时与单次请求总超时（秒）、连接池大小，HTTP/2 需要安装 h2
+NEWS_CONNECT_TIMEOUT = float(os.getenv("NEWS_CONNECT_TIMEOUT", "5"))
+NEWS_READ_TIMEOUT = float(os.getenv("NEWS_READ_TIMEOUT", "15"))
+NEWS_TOTAL_TIMEOUT = float(os.getenv("NEWS_TOTAL_TIMEOUT", "30"))
+NEWS_MAX_CONNECTIONS = int(os.getenv("NEWS_MAX_CONNECTIONS", "20"))
+NEWS_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("NEWS_MAX_KEEPALIVE_CONNECTIONS", "10"))
+NEWS_KEEPALIVE_EXPIRY = float(os.getenv("NEWS_KEEPALIVE_EXPIRY", "60"))
+NEWS_HTTP2 = os.getenv("NEWS_HTTP2", "true").lower() in ("1", "true", "yes")
+# 多源并发获取：最大并发数、单个新闻源时限与整体时限（秒），超过整体时限时返回已完成的部分结果
+NEWS_FANOUT_CONCURRENCY = int(os.getenv("NEWS_FANOUT_CONCURRENCY", "8"))
+NEWS_SOURCE_DEADLINE = float(os.getenv("NEWS_SOURCE_DEADLINE", str(NEWS_TOTAL_TIMEOUT)))
+NEWS_GLOBAL_DEADLINE = float(os.getenv("NEWS_GLOBAL_DEADLINE", "45"))
+
 # 可用的新闻源列表
 sources_list = ["36kr","51cto","acfun","baidu","bilibili","coolapk","csdn","dgtle","douban","douyin",
                 "earthquake","geekpark","guokr","hupu","ifanr","ithome","juejin","netease","newsmth",
@@ -229,6 +244,32 @@ class NewsManager:
         self.news_cache = {}
         self.latest_headlines = []
         self.base_url = base_url
+        self._client: httpx.AsyncClient | None = None
+
+    def get_client(self) -> httpx.AsyncClient:
+        """返回长期复用的 HTTP 客户端（连接池、keep-alive，上游支持时使用 HTTP/2），首次使用时创建"""
+        if self._client is None or self._client.is_closed:
+            http2 = NEWS_HTTP2 and importlib.util.find_spec("h2") is not None
+            if NEWS_HTTP2 and not http2:
+                logger.warning("未安装 h2，新闻客户端回退到 HTTP/1.1")
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Accept": "application/json"},
+                http2=http2,
+                timeout=httpx.Timeout(NEWS_READ_TIMEOUT, connect=NEWS_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=NEWS_MAX_CONNECTIONS,
+                    max_keepalive_connections=NEWS_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=NEWS_KEEPALIVE_EXPIRY
+                )
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        """关闭 HTTP 客户端，释放连接池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
     def normalize_source(self, source: str) -> str:
         """将输入的新闻源名称转换为标准名称"""
@@ -330,34 +371,70 @@ class NewsManager:
                 "available_sources": self.get_available_sources_formatted()
             }
 
-        headers = {
-            "Accept": "application/json"
-        }
         try:
-            async with httpx.AsyncClient(timeout=300.0) as client:  # 设置300秒超时
+            logger.debug(
+                f"正在获取新闻，来源: {normalized_source} (原输入: {source})")
+            return await self.request_news(normalized_source)
+        except Exception as e:
+            return self.describe_error(normalized_source, e)
+
+    async def request_news(self, normalized_source: str, timeout: float = NEWS_TOTAL_TIMEOUT) -> str:
+        """请求一个已标准化的新闻源并转换为 Markdown；连接/读取超时由客户端控制，timeout 限制整体耗时"""
+        response = await asyncio.wait_for(self.get_client().get(f"/{normalized_source}"), timeout)
+        response.raise_for_status()
+        return self.convert_to_markdown(response.json())
+
+    def describe_error(self, normalized_source: str, error: Exception) -> str:
+        """将获取新闻时的异常转换为返回给用户的错误信息"""
+        if isinstance(error, (httpx.TimeoutException, asyncio.TimeoutError)):
+            logger.error(f"获取新闻超时: {normalized_source}")
+            return f"获取新闻源 {normalized_source} 超时"
+        if isinstance(error, httpx.HTTPStatusError):
+            logger.error(f"HTTP错误: {str(error)}")
+            return f"HTTP错误: {error.response.status_code} - {str(error)}"
+        logger.error(f"获取新闻时出错: {str(error)}")
+        return f"未知错误: {str(error)}"
+
+    async def fan_out(self, targets: dict[str, str]) -> tuple[dict[str, Any], list[str]]:
+        """并发获取多个新闻源，get_all_news 与 get_multi_news 共用
+
+        targets 为 结果键 -> 标准化新闻源。最多 NEWS_FANOUT_CONCURRENCY 个请求同时进行，
+        每个新闻源受 NEWS_SOURCE_DEADLINE 限制（不含排队时间），整体受 NEWS_GLOBAL_DEADLINE 限制；
+        到达整体时限时取消未完成的请求并返回已完成的部分结果。
+
+        Returns:
+            (结果字典, 超时的结果键列表)，结果顺序与 targets 一致
+        """
+        semaphore = asyncio.Semaphore(NEWS_FANOUT_CONCURRENCY)
+        results: dict[str, Any] = {}
+        timed_out: list[str] = []
+
+        async def fetch_one(key: str, normalized_source: str) -> None:
+            async with semaphore:
                 try:
-                    logger.debug(
-                        f"正在获取新闻，来源: {normalized_source} (原输入: {source})")
-                    response = await client.get(self.base_url+f"/{normalized_source}", headers=headers)
-                    response.raise_for_status()
-                    print(response.json())
-                    return self.convert_to_markdown(response.json())
-                except httpx.TimeoutException:
-                    logger.error(f"获取新闻超时: {normalized_source}")
-                    return f"获取新闻源 {normalized_source} 超时"
-                except httpx.HTTPStatusError as e:
-                    logger.error(f"HTTP错误: {str(e)}")
-                    return f"HTTP错误: {e.response.status_code} - {str(e)}"
+                    results[key] = await self.request_news(normalized_source, NEWS_SOURCE_DEADLINE)
                 except Exception as e:
-                    logger.error(f"获取新闻时出错: {str(e)}")
-                    return f"未知错误: {str(e)}"
-        except Exception as e:
-            logger.error(f"创建HTTP客户端时出错: {str(e)}")
-            return f"客户端错误: {str(e)}"
+                    if isinstance(e, (httpx.TimeoutException, asyncio.TimeoutError)):
+                        timed_out.append(key)
+                    results[key] = self.describe_error(normalized_source, e)
+
+        started = time.perf_counter()
+        tasks = [asyncio.ensure_future(fetch_one(key, source)) for key, source in targets.items()]
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=NEWS_GLOBAL_DEADLINE)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        for key, source in targets.items():
+            if key not in results:
+                timed_out.append(key)
+                results[key] = f"获取新闻源 {source} 超时（超过整体时限 {NEWS_GLOBAL_DEADLINE:g} 秒）"
+        logger.info(f"并发获取 {len(targets)} 个新闻源完成，耗时 {time.perf_counter() - started:.2f} 秒，超时 {len(timed_out)} 个")
+        return {key: results[key] for key in targets}, [key for key in targets if key in timed_out]
 
     async def fetch_multi_sources(self, sources: list[str]) -> dict[str, Any]:
         """从多个来源获取新闻"""
-        results = {}
+        targets = {}
         unknown_sources = []
 
         for source in sources:
@@ -370,8 +447,11 @@ class NewsManager:
                 continue
 
             logger.debug(f"批量获取新闻，处理来源: {normalized_source} (原输入: {source})")
-            result = await self.fetch_news(normalized_source)
+            targets[normalized_source] = normalized_source
 
+        fetched, timed_out = await self.fan_out(targets)
+        results = {}
+        for normalized_source, result in fetched.items():
             try:
                 # 如果result是JSON字符串，先解析成Python对象
                 if isinstance(result, str) and (result.startswith('{') or result.startswith('[')):
@@ -390,6 +470,8 @@ class NewsManager:
         # 如果有部分未知源，添加警告信息
         if unknown_sources:
             results["warnings"] = f"以下新闻源无法识别: {', '.join(unknown_sources)}"
+        if timed_out:
+            results["timed_out"] = timed_out
 
         return results
 
@@ -434,41 +516,15 @@ async def get_all_news() -> dict[str, Any]:
         包含所有新闻源数据的字典
     """
     try:
-        all_results = {}
         total_sources = len(sources_list)
         logger.info(f"开始获取所有{total_sources}个新闻源的数据")
 
-        # 减少并发数和超时设置，增加稳定性
-        semaphore = asyncio.Semaphore(3)  # 最多同时3个请求
-
-        # 创建错误列表
-        errors = []
-
-        async def fetch_with_timeout(source):
-            try:
-                # 使用信号量限制并发
-                async with semaphore:
-                    # 直接调用fetch_news，依赖其内部的超时处理
-                    result = await news_mgr.fetch_news(source)
-                    return source, result
-            except Exception as e:
-                logger.error(f"获取新闻源 {source} 时出错: {str(e)}")
-                return source, f"获取错误: {str(e)}"
-
-        # 逐个处理源，而不是使用gather
-        for source in sources_list:
-            try:
-                source_normalized = news_mgr.normalize_source(source)
-                logger.info(f"处理新闻源: {source_normalized}")
-                result = await fetch_with_timeout(source)
-                if isinstance(result, tuple):
-                    src, data = result
-                    all_results[src] = data
-                else:
-                    all_results[source] = f"意外的结果类型: {type(result)}"
-            except Exception as e:
-                logger.error(f"处理源 {source} 时出现异常: {str(e)}")
-                all_results[source] = f"处理错误: {str(e)}"
+        # 所有新闻源并发获取，整体耗时约等于最慢的一个新闻源
+        all_results, timed_out = await news_mgr.fan_out(
+            {source: news_mgr.normalize_source(source) for source in sources_list}
+        )
+        if timed_out:
+            all_results["timed_out"] = timed_out
 
         return all_results
     except Exception as e:
@@ -523,11 +579,17 @@ async def multi_news_summary(sources: str = "") -> str:
     else:
         return f"请帮我总结最新的热点新闻。我已经通过API获取了以下平台的信息：{', '.join(sources_list[:5])}等。请分析热点话题，并提供访问链接。"
 
+async def main() -> None:
+    try:
+        await mcp.run_sse_async()
+    finally:
+        await news_mgr.aclose()
+
 if __name__ == "__main__":
 
     # result=news_mgr.convert_to_markdown(mockdata)
     # print(result,'result')
     # 初始化并运行服务器
     mcp.settings.port = int(os.getenv("HOSTNEWPORT"))
-    mcp.run(transport='sse')
+    asyncio.run(main())
 